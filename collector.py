@@ -3,7 +3,6 @@ from datetime import datetime
 import os
 import sys
 import csv # Still needed for the service if it uses csv writer directly, but not here
-import re # Not used here anymore
 from config import db, CHAT_LOG_DIR # Import db and CHAT_LOG_DIR for dependency injection
 from services.message_writer_service import MessageWriterService
 
@@ -12,7 +11,17 @@ from services.message_writer_service import MessageWriterService
 
 # parse_chat_line function was here, removed as it was unused.
 
-def store_chat_messages(video_id):
+def _report_log_path(report_fd, path):
+    """Sends the CSV path to the API process over the pipe it passed in, then closes our end."""
+    try:
+        if path:
+            os.write(report_fd, (path + "\n").encode("utf-8"))
+    except OSError as e:
+        print(f"Could not report log file to parent process: {e}")
+    finally:
+        os.close(report_fd)
+
+def store_chat_messages(video_id, report_fd=None):
     chat = pytchat.create(video_id=video_id)
 
     # Instantiate the message writer service
@@ -24,40 +33,53 @@ def store_chat_messages(video_id):
         print(f"Error initializing MessageWriterService: {e}")
         # Depending on how MessageWriterService handles init errors (e.g., if create_chat_log_file fails),
         # this might need more robust error handling or the service ensures it can be instantiated.
+        if report_fd is not None:
+            _report_log_path(report_fd, None) # Closing the pipe tells the parent there is no file
         return # Exit if service cannot be initialized
 
     csv_log_filename = writer_service.get_csv_filepath()
+    if report_fd is not None:
+        _report_log_path(report_fd, csv_log_filename)
     print(f"Storing chat messages. CSV: {csv_log_filename}, MongoDB Collection: messages_{video_id}")
 
+    # A single dict is reused for every message; write_message copies what it needs
+    message_data = {"video_id": video_id}
     try:
-        while chat.is_alive():
-            for c in chat.get().sync_items():
-                message_data = {
-                    "video_id": video_id, # Ensure video_id is included
-                    "datetime": c.datetime,
-                    "author": c.author.name,
-                    "message": c.message,
-                    "superChat": getattr(c, 'amountString', None)
-                }
-
-                # Use the service to write the message
-                writer_service.write_message(message_data)
-
-                # Print to console (as before)
-                print(f"{message_data['datetime']} [{message_data['author']}] - {message_data['message']}"
-                      f"{' (SuperChat: ' + message_data['superChat'] + ')' if message_data['superChat'] else ''}")
+        # Leaving the block writes out any buffered messages and closes the CSV file
+        with writer_service:
+            while chat.is_alive():
+                for c in chat.get().sync_items():
+                    message_data["datetime"] = c.datetime
+                    message_data["author"] = c.author.name
+                    message_data["message"] = c.message
+                    message_data["superChat"] = getattr(c, 'amountString', None)
+
+                    # Use the service to write the message
+                    writer_service.write_message(message_data)
+
+                    # Print to console (as before)
+                    print(f"{message_data['datetime']} [{message_data['author']}] - {message_data['message']}"
+                          f"{' (SuperChat: ' + message_data['superChat'] + ')' if message_data['superChat'] else ''}")
 
     except KeyboardInterrupt:
         print("\nStopping chat collection...")
     except Exception as e:
         print(f"An error occurred during chat collection: {str(e)}")
-    finally:
-        # The CSV file is managed (opened and closed per write or kept open) by the service.
-        # Here, we just confirm where it was being saved.
-        print(f"\nChat messages have been saved to {csv_log_filename} and MongoDB.")
+    print(f"\nChat messages have been saved to {csv_log_filename} and MongoDB.")
 
 if __name__ == "__main__":
     if len(sys.argv) < 2:
-        print("Usage: python collector.py <video_id>")
+        print("Usage: python collector.py <video_id> | python collector.py --standby <report_fd>")
         sys.exit(1)
-    store_chat_messages(sys.argv[1])
+    if sys.argv[1] == "--standby":
+        # Started ahead of time by process_service's warm pool: the imports above and the MongoDB client
+        # are already set up by the time the video_id arrives on stdin. report_fd is the write end of a
+        # pipe used to report the CSV file path. EOF without a video_id means the pool is shutting down.
+        report_fd = int(sys.argv[2])
+        video_id = sys.stdin.readline().strip()
+        if not video_id:
+            os.close(report_fd)
+            sys.exit(0)
+        store_chat_messages(video_id, report_fd=report_fd)
+    else:
+        store_chat_messages(sys.argv[1])
@@ -10,10 +10,26 @@ if not MONGO_URI:
     sys.exit(1) # Exit if MONGO_URI is not set
 
 try:
-    mongo_client = MongoClient(MONGO_URI, server_api=ServerApi('1'))
-    # Ping MongoDB to verify connection during initialization
-    mongo_client.admin.command('ping')
-    print("[Config] Pinged your deployment. You successfully connected to MongoDB!")
+    # Pool settings tuned for bursty chat writes: keep a few warm TLS connections around
+    # instead of re-handshaking with Atlas on every burst, and compress the text-heavy
+    # payloads on the wire (zstd when available, otherwise zlib).
+    # Write concern is left at the default here; MessageWriterService opts into w=0 for its inserts.
+    mongo_client = MongoClient(
+        MONGO_URI,
+        server_api=ServerApi('1'),
+        maxPoolSize=20,
+        minPoolSize=5,
+        maxIdleTimeMS=60000,
+        compressors="zstd,zlib",
+        retryWrites=True,
+    )
+    # Ping MongoDB to verify connection during initialization.
+    # Collector subprocesses are started with MONGO_PING_ON_STARTUP=0: the API process has already
+    # verified the deployment, and skipping the blocking round-trip lets the client's background
+    # monitor finish the TLS handshake while the collector is connecting to the YouTube chat.
+    if os.environ.get("MONGO_PING_ON_STARTUP", "1") != "0":
+        mongo_client.admin.command('ping')
+        print("[Config] Pinged your deployment. You successfully connected to MongoDB!")
 except Exception as e:
     print(f"[Config] MongoDB Connection error: {e}")
     # Exit if connection fails, as the application relies on it
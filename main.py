@@ -4,13 +4,15 @@
 from fastapi import FastAPI, BackgroundTasks, HTTPException
 from fastapi.middleware.cors import CORSMiddleware
 from typing import List
+from contextlib import asynccontextmanager
+from functools import lru_cache
 import os
 import pytchat
 from datetime import datetime
 import asyncio
 import csv # Still needed for chat_callback, if that remains here
-import re # May not be needed after refactor
-from fastapi.responses import JSONResponse
+from fastapi.responses import JSONResponse, StreamingResponse
+import orjson
 
 # Service imports
 from services import process_service
@@ -19,7 +21,21 @@ from services import chat_data_service
 # Config imports for dependency injection into services
 from config import db, CHAT_LOG_DIR
 
-app = FastAPI()
+class ORJSONResponse(JSONResponse):
+    """JSON response rendered with orjson, which is several times faster than the stdlib json module on large message lists."""
+    def render(self, content) -> bytes:
+        return orjson.dumps(content, option=orjson.OPT_NON_STR_KEYS)
+
+# Number of standby collector processes kept ready so /start_chat does not pay interpreter start-up
+COLLECTOR_WARM_POOL_SIZE = int(os.environ.get("COLLECTOR_WARM_POOL_SIZE", "2"))
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    process_service.prewarm_collectors(COLLECTOR_WARM_POOL_SIZE)
+    yield
+    process_service.shutdown_warm_pool()
+
+app = FastAPI(default_response_class=ORJSONResponse, lifespan=lifespan)
 
 # Note: Consider moving get_messages_collection to chat_data_service.py as well
 # For now, keeping it as it is used by chat_callback which is also in main.py
@@ -45,8 +61,12 @@ app.add_middleware(
 # The connection ping is also handled in config.py
 
 # --- Potentially move to chat_data_service.py or a db_utils.py ---
+@lru_cache(maxsize=128)
 def get_messages_collection(video_id: str):
-    """Get a collection for the specific video stream."""
+    """
+    Get a collection for the specific video stream.
+    The handle is cached, so chat_callback does not build a new Collection for every batch.
+    """
     collection_name = f"messages_{video_id}" # Consistent with chat_data_service
     return db[collection_name]
 # --- End of section to potentially move ---
@@ -58,29 +78,39 @@ def get_messages_collection(video_id: str):
 # If these were to be moved, a service might need to accept BackgroundTasks instance
 # or use a different mechanism for background operations.
 
+def _append_csv_rows(filename: str, rows: list[tuple]):
+    """Appends a batch of rows to a chat log CSV with a single writerows() call."""
+    with open(filename, 'a', newline='', encoding='utf-8') as file:
+        csv.writer(file).writerows(rows)
+
 async def chat_callback(chatdata, filename, video_id):
     # This function is called by pytchat's LiveChatAsync, not directly an endpoint.
     # It uses get_messages_collection, which needs `db` from config.
     print(f"Callback triggered, items: {len(chatdata.items)}")
+    rows = []
+    db_messages = []
+    for c in chatdata.items:
+        amount = getattr(c, 'amountString', None) # SuperChat amount
+        rows.append((c.datetime, c.author.name, c.message, amount or ''))
+        db_messages.append({
+            "datetime": c.datetime,
+            "author": c.author.name,
+            "message": c.message,
+            "amountString": amount,
+            "video_id": video_id # Add video_id for DB context
+        })
+
     async with asyncio.Lock(): # Ensure atomic file writes and DB inserts if needed
-        with open(filename, 'a', newline='', encoding='utf-8') as file:
-            writer = csv.writer(file)
+        if rows:
+            # One writerows() call and one insert_many() per callback batch. Both block, so they run
+            # in worker threads, side by side, instead of stalling the event loop on disk and network I/O.
             collection = get_messages_collection(video_id) # Uses local/imported get_messages_collection
-            for c in chatdata.items:
-                message = {
-                    "datetime": c.datetime,
-                    "author": c.author.name,
-                    "message": c.message,
-                    "amountString": getattr(c, 'amountString', None) # SuperChat amount
-                }
-                writer.writerow([
-                    message['datetime'], message['author'], message['message'], message['amountString'] or ''
-                ])
-                # Also store in MongoDB
-                db_message = message.copy()
-                db_message["video_id"] = video_id # Add video_id for DB context
-                collection.insert_one(db_message)
-                await chatdata.tick_async()
+            await asyncio.gather(
+                asyncio.to_thread(_append_csv_rows, filename, rows),
+                asyncio.to_thread(collection.insert_many, db_messages, ordered=False),
+            )
+        for _ in chatdata.items:
+            await chatdata.tick_async()
 
 async def collect_chat_async(video_id: str, filename: str):
     # Also part of pytchat background processing.
@@ -90,10 +120,16 @@ async def collect_chat_async(video_id: str, filename: str):
     async def callback_for_pytchat(chatdata_from_pytchat):
         await chat_callback(chatdata_from_pytchat, filename, video_id)
 
+    livechat = None
     try:
         livechat = LiveChatAsync(video_id, callback=callback_for_pytchat, interruptable=False)
-        while livechat.is_alive():
-            await asyncio.sleep(3) # Check liveness periodically
+        # Wait on pytchat's fetch task itself instead of polling is_alive(): this wakes up
+        # exactly when the stream ends, and cancelling this coroutine stops collection immediately.
+        await asyncio.wait([livechat.listen_task])
+    except asyncio.CancelledError:
+        if livechat is not None:
+            livechat.terminate()
+        raise
     except Exception as e:
         print(f"[yt-backend] Error collecting chat for {video_id}: {e}")
     finally:
@@ -104,8 +140,10 @@ async def collect_chat_async(video_id: str, filename: str):
 
 
 # API Endpoints - Refactored to use services
+# A plain def endpoint runs in FastAPI's threadpool: starting a collector waits on the
+# collector's pipe handshake, which must not block the event loop.
 @app.post("/start_chat/{video_id}")
-async def start_chat_collection_endpoint(video_id: str, background_tasks: BackgroundTasks):
+def start_chat_collection_endpoint(video_id: str, background_tasks: BackgroundTasks):
     # This endpoint now uses process_service to start the collector.
     # The actual pytchat collection (collect_chat_async) is complex to move entirely
     # to a synchronous service due to its async nature and BackgroundTasks.
@@ -131,13 +169,19 @@ def list_chat_logs_endpoint():
 
 @app.get("/chat_log/{filename}")
 def get_chat_log_endpoint(filename: str):
-    # HTTPException is handled by the service
-    return chat_data_service.get_log_file_messages(filename, chat_log_dir=CHAT_LOG_DIR)
+    # HTTPException is raised by the service before streaming starts.
+    # The JSON body is streamed while the CSV is read instead of being built in memory first.
+    return StreamingResponse(
+        chat_data_service.stream_log_file_messages(filename, chat_log_dir=CHAT_LOG_DIR),
+        media_type="application/json"
+    )
 
 @app.get("/messages/{video_id}")
 def get_messages_endpoint(video_id: str):
-    # HTTPException is handled by the service
-    return chat_data_service.get_db_messages(video_id, db_client=db)
+    # HTTPException is handled by the service.
+    # Returning the response directly skips FastAPI's jsonable_encoder pass over every message;
+    # the documents are plain str/number dicts (no _id), which orjson encodes as they are.
+    return ORJSONResponse(chat_data_service.get_db_messages(video_id, db_client=db))
 
 @app.post("/analyze/{video_id}")
 def analyze_messages_endpoint(video_id: str):
@@ -146,8 +190,11 @@ def analyze_messages_endpoint(video_id: str):
 
 @app.get("/chat_log_messages/{video_id}")
 def get_chat_log_messages_endpoint(video_id: str):
-    # HTTPException is handled by the service
-    return chat_data_service.get_latest_csv_messages(video_id, chat_log_dir=CHAT_LOG_DIR)
+    # HTTPException is raised by the service before streaming starts
+    return StreamingResponse(
+        chat_data_service.stream_latest_csv_messages(video_id, chat_log_dir=CHAT_LOG_DIR),
+        media_type="application/json"
+    )
 
 @app.post("/import_csv_to_mongo/{video_id}")
 def import_csv_to_mongo_endpoint(video_id: str):
@@ -1,10 +1,40 @@
 import os
 import csv
-from datetime import datetime
-from fastapi import HTTPException, JSONResponse
+import orjson
+from collections.abc import Iterator
+from datetime import datetime, timedelta
+from fastapi import HTTPException
+from pymongo.errors import BulkWriteError
+
+from utils import MESSAGE_DEDUP_KEYS, ensure_message_indexes
+
+try:
+    # Optional: pyarrow parses CSV logs in native code. Without it the stdlib csv module is used.
+    import pyarrow as pa
+    import pyarrow.compute as pc
+    import pyarrow.csv as pacsv
+except ImportError:
+    pa = pc = pacsv = None
 
 # Dependencies db and CHAT_LOG_DIR will be passed as arguments
 
+# Names of collections whose indexes have already been ensured by this process
+_indexed_collections = set()
+
+# Latest chat log path per (chat_log_dir, video_id), stored with the directory mtime it was computed at
+_latest_log_cache: dict[tuple[str, str], tuple[int, str | None]] = {}
+
+# Number of messages encoded into each chunk of a streamed JSON response
+_STREAM_CHUNK_MESSAGES = 256
+
+# Read buffer for chat log CSVs opened with the stdlib reader; the 8 KiB default means a read() per 8 KiB of log.
+# (pyarrow's reader already reads in 1 MiB blocks.)
+_CSV_READ_BUFFERING = 1 << 20
+
+# Column layout of the chat log CSV files written by utils.create_chat_log_file / MessageWriterService
+CSV_COLUMNS = ['datetime', 'author', 'message', 'superChat']
+CSV_DATETIME_FORMAT = "%Y-%m-%d %H:%M:%S"
+
 def get_messages_collection_name(video_id: str) -> str:
     """Constructs the MongoDB collection name for a given video_id."""
     return f"messages_{video_id}"
@@ -22,28 +52,151 @@ def list_log_files(chat_log_dir: str) -> list[str]:
         print(f"Error listing log files in {chat_log_dir}: {e}")
         return [] # Or raise an appropriate exception
 
-def get_log_file_messages(filename: str, chat_log_dir: str) -> dict:
-    """Retrieves messages from a specific CSV chat log file in the given chat_log_dir."""
+def _get_log_file_path(filename: str, chat_log_dir: str) -> str:
+    """Returns the path of a chat log file in chat_log_dir, raising a 404 if it does not exist."""
     filepath = os.path.join(chat_log_dir, filename)
     if not os.path.exists(filepath) or not os.path.isfile(filepath):
         raise HTTPException(status_code=404, detail=f"File '{filename}' not found in {chat_log_dir}.")
+    return filepath
 
-    messages = []
+def _to_timestamp_ms(value: str) -> int:
+    """Converts a chat datetime string to a Unix timestamp in milliseconds, or 0 if it cannot be parsed."""
     try:
-        with open(filepath, 'r', newline='', encoding='utf-8') as f:
-            reader = csv.reader(f)
-            next(reader)  # Skip header row
-            for row in reader:
-                if len(row) >= 4:
-                    messages.append({
-                        "datetime": row[0],
-                        "author": row[1],
-                        "message": row[2],
-                        "superChat": row[3]
-                    })
-        return {"messages": messages}
+        dt_obj = datetime.strptime(value, CSV_DATETIME_FORMAT)
+        return int(dt_obj.timestamp() * 1000)
+    except Exception: # Handle cases where datetime format might be unexpected
+        return 0
+
+def _iter_csv_messages(f, video_id: str | None = None) -> Iterator[dict]:
+    """
+    Yields one message dict per row of an open chat log CSV file, skipping the header,
+    and closes the file when done.
+    When video_id is given, each message also gets the video_id and a numeric timestamp.
+    """
+    try:
+        reader = csv.reader(f)
+        next(reader, None)  # Skip header row
+        for row in reader:
+            if len(row) >= 4:
+                msg = {
+                    "datetime": row[0],
+                    "author": row[1],
+                    "message": row[2],
+                    "superChat": row[3]
+                }
+                if video_id is not None:
+                    msg["video_id"] = video_id
+                    msg["timestamp"] = _to_timestamp_ms(row[0])
+                yield msg
+    finally:
+        f.close()
+
+def _local_timestamps_ms(naive_ms):
+    """
+    Converts naive wall-clock times (milliseconds as if UTC) to Unix timestamps in milliseconds,
+    treating them as local time like datetime.timestamp() does.
+    A batch normally falls within one UTC offset, so the offset is applied as a single vectorized subtraction.
+    """
+    def local_offset_ms(wall_ms: int) -> int:
+        wall = datetime(1970, 1, 1) + timedelta(milliseconds=wall_ms)
+        return wall_ms - int(wall.timestamp() * 1000)
+
+    bounds = pc.min_max(naive_ms)
+    lo, hi = bounds["min"].as_py(), bounds["max"].as_py()
+    if lo is None: # Nothing parsed in this batch
+        return naive_ms
+    offset = local_offset_ms(lo)
+    if offset == local_offset_ms(hi):
+        return pc.subtract(naive_ms, offset)
+    # The batch spans a DST change: fall back to a per-row offset
+    return pa.array([None if v is None else v - local_offset_ms(v) for v in naive_ms.to_pylist()], type=pa.int64())
+
+def _iter_arrow_messages(reader, video_id: str | None = None) -> Iterator[dict]:
+    """
+    Yields message dicts from a pyarrow streaming CSV reader, one record batch at a time.
+    Timestamps are parsed for the whole batch at once instead of per row.
+    """
+    try:
+        for batch in reader:
+            if video_id is not None:
+                naive = pc.strptime(batch.column("datetime"), format=CSV_DATETIME_FORMAT, unit="ms", error_is_null=True)
+                timestamps = pc.fill_null(_local_timestamps_ms(naive.cast(pa.int64())), 0)
+                batch = pa.RecordBatch.from_arrays(
+                    batch.columns + [pa.repeat(video_id, batch.num_rows), timestamps],
+                    names=CSV_COLUMNS + ["video_id", "timestamp"]
+                )
+            yield from batch.to_pylist()
+    finally:
+        reader.close()
+
+def _iter_file_messages(filepath: str, video_id: str | None = None) -> Iterator[dict]:
+    """
+    Opens a chat log CSV file and returns an iterator over its messages.
+    The file is opened eagerly so errors surface before any response is sent.
+    Uses pyarrow when it is installed, otherwise the stdlib csv module.
+    """
+    if pacsv is not None:
+        if os.path.getsize(filepath) == 0: # pyarrow rejects empty files, csv.reader yields nothing
+            return iter(())
+        reader = pacsv.open_csv(
+            filepath,
+            read_options=pacsv.ReadOptions(column_names=CSV_COLUMNS, skip_rows=1),
+            # Rows without the expected columns are skipped, like the len(row) check in _iter_csv_messages
+            parse_options=pacsv.ParseOptions(newlines_in_values=True, invalid_row_handler=lambda row: "skip"),
+            convert_options=pacsv.ConvertOptions(
+                column_types={column: pa.string() for column in CSV_COLUMNS},
+                strings_can_be_null=False,
+                quoted_strings_can_be_null=False
+            )
+        )
+        return _iter_arrow_messages(reader, video_id)
+
+    f = open(filepath, 'r', newline='', encoding='utf-8', buffering=_CSV_READ_BUFFERING)
+    return _iter_csv_messages(f, video_id)
+
+def _stream_messages_json(messages: Iterator[dict], source: str) -> Iterator[bytes]:
+    """
+    Encodes messages as a {"messages": [...]} JSON document chunk by chunk, so a response
+    can be sent while the CSV file is still being read. Closes the message iterator when done.
+    """
+    try:
+        yield b'{"messages":['
+        parts = []
+        separator = b""
+        for msg in messages:
+            parts.append(separator + orjson.dumps(msg))
+            separator = b","
+            if len(parts) >= _STREAM_CHUNK_MESSAGES:
+                yield b"".join(parts)
+                parts = []
+        yield b"".join(parts) + b"]}"
+    except Exception as e:
+        # Headers are already sent at this point, so the error can only be logged
+        print(f"Error streaming messages from '{source}': {e}")
+        raise
+    finally:
+        if hasattr(messages, "close"):
+            messages.close()
+
+def get_log_file_messages(filename: str, chat_log_dir: str) -> dict:
+    """Retrieves messages from a specific CSV chat log file in the given chat_log_dir."""
+    filepath = _get_log_file_path(filename, chat_log_dir)
+    try:
+        return {"messages": list(_iter_file_messages(filepath))}
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error reading file '{filename}': {str(e)}")
+
+def stream_log_file_messages(filename: str, chat_log_dir: str) -> Iterator[bytes]:
+    """
+    Same response body as get_log_file_messages, but produced incrementally as JSON bytes
+    while the file is read, so memory use does not grow with the size of the log.
+    """
+    filepath = _get_log_file_path(filename, chat_log_dir)
+    try:
+        messages = _iter_file_messages(filepath)
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error reading file '{filename}': {str(e)}")
+    return _stream_messages_json(messages, filename)
 
 def get_db_messages(video_id: str, db_client) -> dict:
     """Retrieves all messages for a video_id from MongoDB using the provided db_client."""
@@ -60,13 +213,26 @@ def _get_latest_chat_log_file_path(video_id: str, chat_log_dir: str) -> str | No
     """
     Internal helper to find the path of the latest chat log CSV file for a video_id
     in the specified chat_log_dir.
+    The result is cached until the directory's mtime changes, i.e. until a log file is created,
+    deleted or renamed, so repeated calls cost a single stat() instead of a directory scan.
     """
     try:
-        files = [f for f in os.listdir(chat_log_dir) if f.startswith(f"chat_log_{video_id}_") and f.endswith(".csv")]
-        if not files:
-            return None
-        latest_file = max(files, key=lambda f: os.path.getctime(os.path.join(chat_log_dir, f)))
-        return os.path.join(chat_log_dir, latest_file)
+        dir_mtime = os.stat(chat_log_dir).st_mtime_ns
+        cache_key = (chat_log_dir, video_id)
+        cached = _latest_log_cache.get(cache_key)
+        if cached is not None and cached[0] == dir_mtime:
+            return cached[1]
+
+        prefix = f"chat_log_{video_id}_"
+        with os.scandir(chat_log_dir) as it:
+            latest = max(
+                (entry for entry in it if entry.name.startswith(prefix) and entry.name.endswith(".csv")),
+                key=lambda entry: entry.stat().st_ctime,
+                default=None
+            )
+        latest_path = latest.path if latest is not None else None
+        _latest_log_cache[cache_key] = (dir_mtime, latest_path)
+        return latest_path
     except FileNotFoundError:
         return None # Should not happen if chat_log_dir is managed properly
     except Exception as e:
@@ -81,7 +247,7 @@ def import_csv_to_db(video_id: str, db_client, chat_log_dir: str) -> dict:
 
     messages_to_insert = []
     try:
-        with open(log_file_path, 'r', newline='', encoding='utf-8') as f:
+        with open(log_file_path, 'r', newline='', encoding='utf-8', buffering=_CSV_READ_BUFFERING) as f:
             reader = csv.reader(f)
             next(reader)  # Skip header row
             for row in reader:
@@ -102,61 +268,74 @@ def import_csv_to_db(video_id: str, db_client, chat_log_dir: str) -> dict:
 
     collection_name = get_messages_collection_name(video_id)
     collection = db_client[collection_name]
-    inserted_count = 0
-
-    # Consider bulk operations for efficiency if dealing with very large CSVs
-    for msg in messages_to_insert:
-        # Check for duplicates based on a combination of fields
-        # This simple check might not be perfectly robust for all edge cases (e.g., clock sync issues)
-        # A more robust approach might involve unique IDs generated by the collector if possible.
-        if not collection.find_one({
-            "video_id": msg["video_id"],
-            "datetime": msg["datetime"],
-            "author": msg["author"],
-            "message": msg["message"] # Comparing full message might be problematic for long messages or slight variations
-        }):
-            try:
-                collection.insert_one(msg)
-                inserted_count += 1
-            except Exception as e:
-                # Log the specific error and message that failed
-                print(f"Failed to insert message for {video_id} into DB: {msg}, Error: {e}")
-                # Depending on requirements, either continue or raise an error
+
+    try:
+        _ensure_dedup_index(collection, collection_name)
+    except Exception as e:
+        # Typically the collection already holds duplicates, so the unique index cannot be built.
+        # Fall back to filtering out messages that are already stored before inserting.
+        print(f"Could not create unique index on {collection_name}, filtering duplicates client-side: {e}")
+        existing = {
+            (doc.get("datetime"), doc.get("author"), doc.get("message"))
+            for doc in collection.find({"video_id": video_id}, {"_id": 0, "datetime": 1, "author": 1, "message": 1})
+        }
+        new_messages = []
+        for msg in messages_to_insert:
+            key = (msg["datetime"], msg["author"], msg["message"])
+            if key not in existing:
+                existing.add(key) # Also drops duplicates within the CSV itself
+                new_messages.append(msg)
+        messages_to_insert = new_messages
+        if not messages_to_insert:
+            return {"inserted_count": 0, "message": f"Imported 0 new messages to MongoDB from {os.path.basename(log_file_path)}."}
+
+    # One bulk write instead of a find_one + insert_one round-trip per row.
+    # With ordered=False MongoDB keeps going past duplicate-key errors and reports how many were inserted.
+    try:
+        result = collection.insert_many(messages_to_insert, ordered=False)
+        inserted_count = len(result.inserted_ids)
+    except BulkWriteError as e:
+        inserted_count = e.details.get("nInserted", 0)
+        other_errors = [err for err in e.details.get("writeErrors", []) if err.get("code") != 11000]
+        if other_errors:
+            print(f"Failed to insert {len(other_errors)} messages for {video_id} into DB: {other_errors[0].get('errmsg')}")
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error importing messages for {video_id} into database: {str(e)}")
 
     return {"inserted_count": inserted_count, "message": f"Imported {inserted_count} new messages to MongoDB from {os.path.basename(log_file_path)}."}
 
+def _ensure_dedup_index(collection, collection_name: str):
+    """Creates the unique dedup index (and lookup index) on a messages collection once per process."""
+    if collection_name in _indexed_collections:
+        return
+    ensure_message_indexes(collection)
+    _indexed_collections.add(collection_name)
+
 def get_latest_csv_messages(video_id: str, chat_log_dir: str) -> dict:
     """Retrieves all messages from the latest chat log CSV file for a video_id, including a numeric timestamp."""
     log_file_path = _get_latest_chat_log_file_path(video_id, chat_log_dir)
     if not log_file_path:
         raise HTTPException(status_code=404, detail=f"Chat log file not found for video ID {video_id} in {chat_log_dir}.")
 
-    messages = []
     try:
-        with open(log_file_path, 'r', newline='', encoding='utf-8') as f:
-            reader = csv.reader(f)
-            next(reader)  # Skip header row
-            for row in reader:
-                if len(row) >= 4:
-                    msg = {
-                        "datetime": row[0],
-                        "author": row[1],
-                        "message": row[2],
-                        "superChat": row[3],
-                        "video_id": video_id
-                    }
-                    try:
-                        # Attempt to parse datetime and create a Unix timestamp (milliseconds)
-                        dt_obj = datetime.strptime(msg["datetime"], "%Y-%m-%d %H:%M:%S")
-                        msg["timestamp"] = int(dt_obj.timestamp() * 1000)
-                    except ValueError: # Handle cases where datetime format might be unexpected
-                        msg["timestamp"] = 0 # Or None, or log an error
-                    except Exception: # Catch any other parsing related error
-                        msg["timestamp"] = 0
-                    messages.append(msg)
-        return {"messages": messages}
+        return {"messages": list(_iter_file_messages(log_file_path, video_id))}
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error reading or processing CSV file '{os.path.basename(log_file_path)}': {str(e)}")
+
+def stream_latest_csv_messages(video_id: str, chat_log_dir: str) -> Iterator[bytes]:
+    """
+    Same response body as get_latest_csv_messages, but produced incrementally as JSON bytes
+    while the file is read.
+    """
+    log_file_path = _get_latest_chat_log_file_path(video_id, chat_log_dir)
+    if not log_file_path:
+        raise HTTPException(status_code=404, detail=f"Chat log file not found for video ID {video_id} in {chat_log_dir}.")
+
+    try:
+        messages = _iter_file_messages(log_file_path, video_id)
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error reading or processing CSV file '{os.path.basename(log_file_path)}': {str(e)}")
+    return _stream_messages_json(messages, os.path.basename(log_file_path))
 
 
 def analyze_video_messages(video_id: str, db_client) -> dict:
@@ -167,7 +346,8 @@ def analyze_video_messages(video_id: str, db_client) -> dict:
     collection_name = get_messages_collection_name(video_id)
     collection = db_client[collection_name]
     try:
-        count = collection.count_documents({})
+        # Read the count from collection metadata instead of scanning the collection
+        count = collection.estimated_document_count()
         return {"video_id": video_id, "message_count": count, "analysis_status": "Placeholder - analysis not implemented."}
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error analyzing messages for {video_id}: {str(e)}")
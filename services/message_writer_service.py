@@ -1,12 +1,24 @@
 import csv
 import os
+import queue
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
 
-from utils import create_chat_log_file # For creating the CSV log file
+from pymongo import WriteConcern
+
+from utils import create_chat_log_file, ensure_message_indexes # For creating the CSV log file and Mongo indexes
 # db and CHAT_LOG_DIR will be passed as arguments
 
+# Marks the end of the CSV row queue; the writer thread exits when it sees it.
+_STOP = object()
+
 class MessageWriterService:
     """
     Handles writing chat messages to both CSV and MongoDB.
+    CSV rows are written by a background thread so disk I/O never stalls the chat loop,
+    and MongoDB inserts are buffered and sent in batches with insert_many from a worker thread.
     """
     def __init__(self, video_id: str, db_client, chat_log_directory: str):
         self.video_id = video_id
@@ -17,46 +29,165 @@ class MessageWriterService:
         self.csv_filepath = create_chat_log_file(video_id, self.chat_log_dir)
         print(f"[MessageWriterService] CSV log file initialized at: {self.csv_filepath}")
 
-        # Get the MongoDB collection using the passed-in db_client
+        # Keep the CSV file open for the lifetime of the service instead of reopening it per message.
+        # Only the writer thread touches the file handle after this point.
+        self._csv_fh = open(self.csv_filepath, 'a', newline='', encoding='utf-8', buffering=64 * 1024)
+        self._csv_writer = csv.writer(self._csv_fh)
+        self._csv_batch_size = 64
+        self._csv_flush_interval = 1.0 # seconds
+        self._row_q = queue.Queue(maxsize=10000)
+        self._csv_thread = threading.Thread(target=self._csv_worker, name=f"csv-writer-{video_id}", daemon=True)
+        self._csv_thread.start()
+        self._closed = False
+
+        # Get the MongoDB collection using the passed-in db_client.
+        # w=0 (fire-and-forget) removes the acknowledgement round-trip from every batch.
         self.mongo_collection_name = f"messages_{video_id}"
-        self.mongo_collection = db_client[self.mongo_collection_name]
+        self.mongo_collection = db_client.get_collection(self.mongo_collection_name, write_concern=WriteConcern(w=0))
         print(f"[MessageWriterService] Using MongoDB collection: {self.mongo_collection_name}")
 
-    def write_message(self, message_data: dict):
+        # Buffer for batched MongoDB inserts, flushed when full or when the flush interval has elapsed
+        self._mongo_buf = []
+        self._buf_size = 100
+        self._flush_interval = 2.0 # seconds
+        self._last_flush = time.monotonic()
+        # A single worker keeps batches in order; pymongo releases the GIL while it waits on the network,
+        # so the chat loop keeps parsing messages while a batch is in flight.
+        self._mongo_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix=f"mongo-writer-{video_id}")
+        # Free-list of document dicts: once a batch has been sent its dicts are cleared and reused,
+        # so a long-running stream stops allocating a new dict per message.
+        self._dict_pool = deque(maxlen=256)
+        # Index creation is a server round-trip; run it on the worker so it does not delay startup.
+        # It is queued ahead of the first batch.
+        self._mongo_executor.submit(self._ensure_indexes)
+        # Specialized per instance; see _make_write_message
+        self.write_message = self._make_write_message()
+
+    def _ensure_indexes(self):
+        """Runs on the MongoDB worker thread. Index builds need an acknowledged write concern."""
+        try:
+            ensure_message_indexes(self.mongo_collection.with_options(write_concern=WriteConcern(w=1)))
+        except Exception as e:
+            # E.g. the collection already holds duplicates; inserts still work without the unique index
+            print(f"[MessageWriterService] Could not create indexes on {self.mongo_collection_name}: {e}")
+
+    def _make_write_message(self):
         """
-        Writes a single message to both the CSV file and MongoDB.
-        message_data should be a dictionary containing all necessary fields
-        including 'video_id'.
+        Builds write_message as a closure over the objects it uses, so the per-message path
+        reads locals instead of looking up attributes on self for every call.
         """
-        if "video_id" not in message_data:
-            # Ensure video_id is part of the message_data for MongoDB consistency,
+        put_row = self._row_q.put
+        pool = self._dict_pool
+        buf = self._mongo_buf # flush() empties this list in place, so the closure can keep it
+        append_doc = buf.append
+        buf_size = self._buf_size
+        flush_interval = self._flush_interval
+        video_id = self.video_id
+        flush = self.flush
+        monotonic = time.monotonic
+
+        def write_message(message_data: dict):
+            """
+            Queues a single message for the CSV file and MongoDB.
+            message_data should be a dictionary containing all necessary fields;
+            'video_id' defaults to the service's video_id.
+            The data is copied, so callers may reuse the same dict for every message.
+            """
+            get = message_data.get
+
+            # 1. Hand the CSV row to the writer thread. put() blocks only if the writer
+            # falls 10000 rows behind, which applies back-pressure instead of dropping messages.
+            put_row((
+                get('datetime', ''),
+                get('author', ''),
+                get('message', ''),
+                get('superChat', '') # Ensure this key exists or provide default
+            ))
+
+            # 2. Buffer for MongoDB. The document is a copy in a pooled dict because insert_many
+            # adds an _id to each document and callers may reuse their dict.
+            doc = pool.popleft() if pool else {}
+            doc.update(message_data)
+            # Ensure video_id is part of the document for MongoDB consistency,
             # though the service is initialized with a video_id.
-            message_data["video_id"] = self.video_id
+            doc.setdefault("video_id", video_id)
+            append_doc(doc)
+            if len(buf) >= buf_size or monotonic() - self._last_flush > flush_interval:
+                flush()
 
-        # 1. Write to CSV file (append mode)
-        try:
-            with open(self.csv_filepath, 'a', newline='', encoding='utf-8') as file:
-                writer = csv.writer(file)
-                writer.writerow([
-                    message_data.get('datetime', ''),
-                    message_data.get('author', ''),
-                    message_data.get('message', ''),
-                    message_data.get('superChat', '') # Ensure this key exists or provide default
-                ])
-        except Exception as e:
-            print(f"[MessageWriterService] Error writing to CSV {self.csv_filepath}: {e}")
-            # Decide if you want to raise the error or just log it and continue to MongoDB
+        return write_message
+
+    def _csv_worker(self):
+        """
+        Writer thread: drains the row queue in batches of up to _csv_batch_size rows,
+        writes each batch with a single writerows() call and flushes the file about once a second.
+        """
+        last_flush = time.monotonic()
+        running = True
+        while running:
+            try:
+                batch = [self._row_q.get(timeout=self._csv_flush_interval)]
+            except queue.Empty:
+                batch = []
+            while batch and len(batch) < self._csv_batch_size:
+                try:
+                    batch.append(self._row_q.get_nowait())
+                except queue.Empty:
+                    break
+            if batch and batch[-1] is _STOP:
+                batch.pop()
+                running = False
+
+            try:
+                if batch:
+                    self._csv_writer.writerows(batch)
+                if not running or time.monotonic() - last_flush >= self._csv_flush_interval:
+                    self._csv_fh.flush()
+                    last_flush = time.monotonic()
+            except Exception as e:
+                print(f"[MessageWriterService] Error writing to CSV {self.csv_filepath}: {e}")
+
+        self._csv_fh.close()
 
-        # 2. Write to MongoDB
+    def flush(self):
+        """Hands buffered messages to the MongoDB worker thread, which writes them in a single insert_many call."""
+        self._last_flush = time.monotonic()
+        if not self._mongo_buf:
+            return
+        batch = self._mongo_buf.copy()
+        self._mongo_buf.clear() # Emptied in place: write_message holds a reference to this list
+        self._mongo_executor.submit(self._insert_batch, batch)
+
+    def _insert_batch(self, batch: list[dict]):
+        """Runs on the MongoDB worker thread. Returns the batch's dicts to the pool once they have been sent."""
         try:
-            self.mongo_collection.insert_one(message_data)
+            self.mongo_collection.insert_many(batch, ordered=False)
         except Exception as e:
-            print(f"[MessageWriterService] Error writing to MongoDB collection {self.mongo_collection_name}: {e}")
-            # Decide if you want to raise the error or just log it
+            print(f"[MessageWriterService] Error writing {len(batch)} messages to MongoDB collection {self.mongo_collection_name}: {e}")
+        finally:
+            for doc in batch:
+                doc.clear()
+                self._dict_pool.append(doc)
+
+    def close(self):
+        """
+        Flushes pending MongoDB messages and waits for them to be sent, stops the CSV writer
+        thread once it has written every queued row, and closes the CSV file.
+        Must be called before the process exits.
+        """
+        if self._closed:
+            return
+        self._closed = True
+        self.flush()
+        self._mongo_executor.shutdown(wait=True)
+        self._row_q.put(_STOP)
+        self._csv_thread.join()
+
+    def __enter__(self):
+        return self
 
-        # Optional: print confirmation for each message written by the service
-        # print(f"[{self.video_id}] {message_data.get('datetime')} [{message_data.get('author')}] - {message_data.get('message')}")
-        # This might be too verbose if collector.py already prints.
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
 
     def get_csv_filepath(self) -> str:
         """Returns the path to the CSV file being managed by this service instance."""
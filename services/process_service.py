@@ -1,19 +1,59 @@
 import subprocess
 import os
+import sys
 import signal
-import psutil
+import queue
+import select
+import threading
+import time
+from dataclasses import dataclass, field
 from fastapi import HTTPException # Import HTTPException
 # CHAT_LOG_DIR will be passed as an argument
 
-# This dictionary will store the PIDs of running collector processes.
-# Key: video_id (str), Value: PID (int)
-collector_processes = {}
+@dataclass(slots=True)
+class CollectorHandle:
+    """
+    A running collector process.
+    pidfd (Linux 5.3+) becomes readable when the process exits and is None where unsupported;
+    it is closed once the collector is reaped. filename is the CSV file the collector reported.
+    """
+    proc: subprocess.Popen
+    pidfd: int | None = None
+    filename: str | None = None
+    started: float = field(default_factory=time.time)
+
+    @property
+    def pid(self) -> int:
+        return self.proc.pid
+
+# This dictionary stores the running collector processes.
+# Key: video_id (str), Value: CollectorHandle of the collector.
+collector_processes: dict[str, CollectorHandle] = {}
+# start/stop run concurrently in FastAPI's threadpool; compound reads and writes of collector_processes
+# (and iterating it) happen under this lock.
+_processes_lock = threading.Lock()
+
+# Seconds a collector gets to exit after SIGINT before it is killed
+STOP_TIMEOUT = 5
+# Seconds to wait for a killed collector to go away
+KILL_TIMEOUT = 2
+
+# Seconds start_collector_process waits for the collector to report the CSV file it created
+HANDSHAKE_TIMEOUT = 5
+
+# Standby collectors: started ahead of time with their imports done and MongoDB client created,
+# each blocked reading a video_id from stdin. Entries are (subprocess.Popen handle, report pipe read fd).
+# Filled by prewarm_collectors() at API startup and topped up after each start.
+_warm_pool = queue.Queue()
+_warm_pool_target = 0
+_refill_lock = threading.Lock()
 
 def start_collector_process(video_id: str, chat_log_dir: str) -> dict:
     """
-    Launches the collector.py script as a subprocess for the given video_id.
-    Manages the collector_processes dictionary.
-    Uses the provided chat_log_dir to find the latest log file.
+    Hands the video_id to a standby collector.py process from the warm pool, or launches one
+    if the pool is empty. Manages the collector_processes dictionary.
+    The collector reports the CSV file it created over a pipe; the returned filename is
+    relative to chat_log_dir, or None if the collector did not report one in time.
     """
     if video_id in collector_processes:
         # Optionally, handle cases where collection is already running
@@ -21,6 +61,51 @@ def start_collector_process(video_id: str, chat_log_dir: str) -> dict:
         # Depending on desired behavior, one might return an error or stop the old one.
         print(f"Warning: Collector process for {video_id} may already be running or was not cleaned up.")
 
+    standby = _take_standby()
+    if standby is None:
+        # Pool empty or disabled: start a collector now and pay the interpreter start-up in this request
+        try:
+            standby = _spawn_standby(_resolve_collector_script())
+        except HTTPException:
+            raise
+        except Exception as e:
+            # Log the full error server-side for debugging
+            print(f"Critical error starting collector process for {video_id}: {e}")
+            raise HTTPException(status_code=500, detail=f"Failed to start collector process for {video_id}. Reason: {str(e)}")
+
+    proc, read_fd = standby
+    try:
+        # Closing stdin after the video_id lets the collector see EOF if it reads again
+        proc.stdin.write(f"{video_id}\n".encode("utf-8"))
+        proc.stdin.close()
+        handle = CollectorHandle(proc, _open_pidfd(proc.pid))
+        with _processes_lock:
+            collector_processes[video_id] = handle
+    except Exception as e:
+        os.close(read_fd)
+        proc.kill()
+        print(f"Critical error starting collector process for {video_id}: {e}")
+        raise HTTPException(status_code=500, detail=f"Failed to start collector process for {video_id}. Reason: {str(e)}")
+
+    if _warm_pool_target:
+        threading.Thread(target=_refill_warm_pool, name="collector-pool-refill", daemon=True).start()
+
+    try:
+        log_path = _read_reported_log_path(read_fd, HANDSHAKE_TIMEOUT)
+    finally:
+        os.close(read_fd)
+
+    if log_path:
+        latest_file = os.path.relpath(log_path, chat_log_dir)
+    else:
+        print(f"Warning: collector for {video_id} did not report its log file within {HANDSHAKE_TIMEOUT}s.")
+        latest_file = None
+    handle.filename = latest_file
+
+    return {"status": "started", "pid": proc.pid, "filename": latest_file}
+
+def _find_collector_script() -> str | None:
+    """Searches the expected locations of collector.py. Returns None if it is not found."""
     script_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "collector.py")
 
     # Ensure the script path is correct relative to this service file
@@ -28,91 +113,198 @@ def start_collector_process(video_id: str, chat_log_dir: str) -> dict:
         # Attempt to find collector.py relative to the project root if started from elsewhere
         project_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
         script_path_alt = os.path.join(project_root, "collector.py")
-        if os.path.exists(script_path_alt):
-            script_path = script_path_alt
-        else:
-            raise HTTPException(status_code=500, detail=f"collector.py script not found at expected locations: {script_path} or {script_path_alt}")
+        if not os.path.exists(script_path_alt):
+            print(f"Error: collector.py script not found at expected locations: {script_path} or {script_path_alt}")
+            return None
+        script_path = script_path_alt
+    return script_path
+
+# Resolved once at import; the location of collector.py does not change while the API runs
+_COLLECTOR_SCRIPT = _find_collector_script()
+
+def _resolve_collector_script() -> str:
+    """Returns the path of collector.py, raising a 500 HTTPException if it was not found at import."""
+    if _COLLECTOR_SCRIPT is None:
+        raise HTTPException(status_code=500, detail="collector.py script not found next to the services package.")
+    return _COLLECTOR_SCRIPT
 
+def _spawn_standby(script_path: str) -> tuple[subprocess.Popen, int]:
+    """
+    Starts collector.py in standby mode. Returns the process and the read end of its report pipe,
+    on which the collector writes the path of its CSV file once it has been given a video_id.
+    """
+    read_fd, write_fd = os.pipe()
     try:
-        proc = subprocess.Popen(["python", script_path, video_id])
-        collector_processes[video_id] = proc.pid
-    except Exception as e:
-        # Log the full error server-side for debugging
-        print(f"Critical error starting collector process for {video_id}: {e}")
-        raise HTTPException(status_code=500, detail=f"Failed to start collector process for {video_id}. Reason: {str(e)}")
+        # Launch with the interpreter running the API (same virtualenv, no PATH lookup for "python")
+        # and let the child skip the startup ping this process already did.
+        child_env = {**os.environ, "MONGO_PING_ON_STARTUP": "0"}
+        # The report fd is inherited rather than passed with pass_fds: pass_fds and close_fds=True rule out
+        # Popen's posix_spawn fast path, while with close_fds=False only inheritable fds reach the child
+        # (everything Python opens is non-inheritable by default).
+        os.set_inheritable(write_fd, True)
+        proc = subprocess.Popen(
+            [sys.executable, script_path, "--standby", str(write_fd)],
+            env=child_env, stdin=subprocess.PIPE, close_fds=False,
+        )
+    except Exception:
+        os.close(read_fd)
+        raise
+    finally:
+        # Only the child keeps the write end open, so the read end sees EOF if the child exits without reporting
+        os.close(write_fd)
+    return proc, read_fd
+
+def _take_standby() -> tuple[subprocess.Popen, int] | None:
+    """Pops a live standby collector from the pool, discarding any that exited while idle."""
+    while True:
+        try:
+            proc, read_fd = _warm_pool.get_nowait()
+        except queue.Empty:
+            return None
+        if proc.poll() is None:
+            return proc, read_fd
+        os.close(read_fd)
+
+def _refill_warm_pool():
+    """Starts standby collectors until the pool is back at its target size."""
+    with _refill_lock:
+        try:
+            script_path = _resolve_collector_script()
+            while _warm_pool.qsize() < _warm_pool_target:
+                _warm_pool.put(_spawn_standby(script_path))
+        except Exception as e:
+            print(f"Error starting standby collector: {e}")
+
+def prewarm_collectors(count: int):
+    """Fills the standby pool with count collectors. Called once at API startup."""
+    global _warm_pool_target
+    _warm_pool_target = count
+    _refill_warm_pool()
 
-    # Try to find the latest log file created by the collector.
-    # This logic might be a bit racy if the collector takes time to create the file.
-    # Consider if the collector script itself should report the filename upon successful start.
-    # The collector.py itself now depends on MessageWriterService which creates the file,
-    # so the file should exist shortly after Popen if collector.py starts quickly.
+def shutdown_warm_pool():
+    """Stops all standby collectors. Closing stdin without a video_id makes them exit on their own."""
+    global _warm_pool_target
+    _warm_pool_target = 0
+    while True:
+        try:
+            proc, read_fd = _warm_pool.get_nowait()
+        except queue.Empty:
+            break
+        os.close(read_fd)
+        try:
+            proc.stdin.close()
+            proc.wait(timeout=STOP_TIMEOUT)
+        except subprocess.TimeoutExpired:
+            proc.kill()
+            proc.wait()
+        except Exception as e:
+            print(f"Error stopping standby collector {proc.pid}: {e}")
+
+def _open_pidfd(pid: int) -> int | None:
+    """Returns a pidfd for pid, or None where pidfds are unsupported (non-Linux, kernel < 5.3)."""
+    if not hasattr(os, "pidfd_open"):
+        return None
     try:
-        # Ensure chat_log_dir exists before listing (though config.py should handle initial creation)
-        os.makedirs(chat_log_dir, exist_ok=True)
-        files = [f for f in os.listdir(chat_log_dir) if f.startswith(f"chat_log_{video_id}_") and f.endswith(".csv")]
-        if files: # Check if files list is not empty
-            latest_file = max(files, key=lambda f: os.path.getctime(os.path.join(chat_log_dir, f)))
-        else:
-            latest_file = None
-    except FileNotFoundError: # Should be less likely if os.makedirs is called
-        print(f"Warning: chat_log_dir {chat_log_dir} not found during latest file check.")
-        latest_file = None
-    except Exception as e: # Other potential errors listing files
-        print(f"Error finding latest log file for {video_id} in {chat_log_dir}: {e}")
-        latest_file = None
+        return os.pidfd_open(pid)
+    except OSError as e:
+        print(f"Could not open pidfd for process {pid}: {e}")
+        return None
 
-    return {"status": "started", "pid": proc.pid, "filename": latest_file}
+def _close_pidfd(pidfd: int | None):
+    if pidfd is not None:
+        os.close(pidfd)
+
+def _read_reported_log_path(fd: int, timeout: float) -> str | None:
+    """Reads the newline-terminated path a collector writes to its report pipe. Returns None on EOF or timeout."""
+    deadline = time.monotonic() + timeout
+    data = b""
+    while not data.endswith(b"\n"):
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            return None
+        readable, _, _ = select.select([fd], [], [], remaining)
+        if not readable:
+            return None
+        chunk = os.read(fd, 4096)
+        if not chunk: # Collector exited or closed the pipe without reporting
+            return None
+        data += chunk
+    return data.decode("utf-8").strip() or None
 
 def stop_collector_process(video_id: str) -> dict:
     """
     Stops the collector.py subprocess for the given video_id.
+    Sends SIGINT through the stored Popen handle and returns immediately; the process is
+    reaped by a background thread, which kills it if it has not exited after STOP_TIMEOUT seconds.
     Manages the collector_processes dictionary.
     """
-    pid = collector_processes.get(video_id)
-    if not pid:
+    # pop() claims the entry, so of two concurrent stops for the same video only one signals the process
+    with _processes_lock:
+        handle = collector_processes.pop(video_id, None)
+    if handle is None:
         raise HTTPException(status_code=404, detail=f"Collector process for video_id '{video_id}' not found or not running.")
 
+    proc, pidfd = handle.proc, handle.pidfd
+    pid = proc.pid
     try:
-        p = psutil.Process(pid)
-        p.send_signal(signal.SIGINT)  # Send SIGINT for graceful shutdown
-        p.wait(timeout=5)  # Wait for the process to terminate
-
-        # Successfully terminated
-        if video_id in collector_processes: # Ensure key exists before deleting
-            del collector_processes[video_id]
-        return {"status": "stopped", "video_id": video_id}
-
-    except psutil.NoSuchProcess:
-        # Process was already gone
-        if video_id in collector_processes:
-            del collector_processes[video_id]
-        # This is effectively a "not found" or "already stopped" situation.
-        # Re-raising as 404 is consistent with it not being actively running.
+        if proc.poll() is not None:
+            raise ProcessLookupError(pid)
+        _send_sigint(pid, pidfd)  # Send SIGINT for graceful shutdown
+    except ProcessLookupError:
+        _close_pidfd(pidfd)
+        # Process was already gone. This is effectively a "not found" or "already stopped" situation.
         raise HTTPException(status_code=404, detail=f"Collector process for video_id '{video_id}' (PID {pid}) was already stopped or not found.")
-
-    except psutil.TimeoutExpired:
-        print(f"Process {pid} for {video_id} did not terminate gracefully, attempting to kill.")
-        try:
-            p.kill()
-            p.wait(timeout=2) # Shorter wait for kill
-            if video_id in collector_processes:
-                del collector_processes[video_id]
-            return {"status": "killed", "detail": f"Process for video_id '{video_id}' (PID {pid}) timed out on SIGINT and was forcefully killed."}
-        except psutil.NoSuchProcess: # Process died during kill attempt
-            if video_id in collector_processes:
-                del collector_processes[video_id]
-            raise HTTPException(status_code=404, detail=f"Collector process for video_id '{video_id}' (PID {pid}) disappeared during kill attempt.")
-        except Exception as e_kill:
-            # Error during the kill attempt itself
-            # Log e_kill for server-side diagnostics
-            print(f"Error during forceful kill of process {pid} for {video_id}: {e_kill}")
-            raise HTTPException(status_code=500, detail=f"Error forcefully stopping process for video_id '{video_id}'. PID: {pid}. Reason: {str(e_kill)}")
-
     except Exception as e:
-        # Other unexpected errors (e.g., permission issues with psutil)
+        # Other unexpected errors (e.g., permission issues)
         print(f"Unexpected error when trying to stop process {pid} for {video_id}: {e}")
         raise HTTPException(status_code=500, detail=f"An unexpected error occurred while stopping collector for video_id '{video_id}'. PID: {pid}. Reason: {str(e)}")
 
+    # Wait for the exit off the request path instead of blocking a worker for up to STOP_TIMEOUT seconds
+    threading.Thread(target=_reap_collector, args=(video_id, proc, pidfd), name=f"reap-collector-{video_id}", daemon=True).start()
+    return {"status": "stopped", "video_id": video_id}
+
+def _send_sigint(pid: int, pidfd: int | None):
+    """
+    Signals the collector directly with a single syscall. Through the pidfd the signal cannot reach
+    an unrelated process that reused the pid. Raises ProcessLookupError if the process is gone.
+    """
+    if pidfd is not None:
+        signal.pidfd_send_signal(pidfd, signal.SIGINT)
+    else:
+        os.kill(pid, signal.SIGINT)
+
+def _wait_for_exit(proc: subprocess.Popen, pidfd: int | None, timeout: float) -> bool:
+    """
+    Waits up to timeout seconds for proc to exit and returns whether it did.
+    With a pidfd this is a single select() that wakes the moment the process exits;
+    otherwise Popen.wait polls.
+    """
+    if pidfd is None:
+        try:
+            proc.wait(timeout=timeout)
+            return True
+        except subprocess.TimeoutExpired:
+            return False
+    readable, _, _ = select.select([pidfd], [], [], timeout)
+    return bool(readable)
+
+def _reap_collector(video_id: str, proc: subprocess.Popen, pidfd: int | None = None):
+    """Waits for a signalled collector to exit, killing it if it does not terminate gracefully."""
+    try:
+        if not _wait_for_exit(proc, pidfd, STOP_TIMEOUT):
+            print(f"Process {proc.pid} for {video_id} did not terminate gracefully, attempting to kill.")
+            try:
+                proc.kill()
+                if not _wait_for_exit(proc, pidfd, KILL_TIMEOUT):
+                    print(f"Process {proc.pid} for {video_id} still running {KILL_TIMEOUT}s after SIGKILL.")
+            except Exception as e:
+                print(f"Error during forceful kill of process {proc.pid} for {video_id}: {e}")
+        if pidfd is not None:
+            proc.poll() # select() only reports the exit; collect the status so no zombie is left behind
+    finally:
+        _close_pidfd(pidfd)
+
 def get_running_processes() -> dict:
-    """Returns a copy of the collector_processes dictionary."""
-    return dict(collector_processes)
+    """Returns a mapping of video_id to the PID of its running collector process."""
+    with _processes_lock: # A concurrent start would otherwise change the dict size mid-iteration
+        return {video_id: handle.pid for video_id, handle in collector_processes.items()}
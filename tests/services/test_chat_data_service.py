@@ -1,9 +1,12 @@
 import pytest
 import os
 import csv
+import json
+from types import SimpleNamespace
 from unittest import mock
 from unittest.mock import MagicMock, patch
 from fastapi import HTTPException
+from pymongo.errors import BulkWriteError
 
 # Functions to test
 from services import chat_data_service
@@ -67,14 +70,35 @@ def test_get_log_file_messages_read_error(temp_chat_log_dir):
 
     # This specific setup won't make csv.reader fail in a way that causes an Exception
     # that isn't already handled by Python's file reading.
-    # A more direct way to test the generic Exception catch:
-    with patch('csv.reader', side_effect=Exception("CSV Read Error")):
+    # A more direct way to test the generic Exception catch (on the stdlib csv path):
+    with patch('services.chat_data_service.pacsv', None), \
+         patch('csv.reader', side_effect=Exception("CSV Read Error")):
         with pytest.raises(HTTPException) as exc_info:
             chat_data_service.get_log_file_messages(filename, temp_chat_log_dir)
         assert exc_info.value.status_code == 500
         assert "Error reading file" in exc_info.value.detail
 
 
+def test_stream_log_file_messages_matches_get(temp_chat_log_dir):
+    filename = "test_stream_log.csv"
+    filepath = os.path.join(temp_chat_log_dir, filename)
+    with open(filepath, 'w', newline='', encoding='utf-8') as f:
+        writer = csv.writer(f)
+        writer.writerow(['datetime', 'author', 'message', 'superChat'])
+        for i in range(600): # More than one streamed chunk
+            writer.writerow([f'2023-01-01 10:{i // 60:02d}:{i % 60:02d}', f'User{i}', f'Merhaba "{i}"', ''])
+
+    body = b"".join(chat_data_service.stream_log_file_messages(filename, temp_chat_log_dir))
+    assert json.loads(body) == chat_data_service.get_log_file_messages(filename, temp_chat_log_dir)
+    assert len(json.loads(body)['messages']) == 600
+
+def test_stream_log_file_messages_not_found(temp_chat_log_dir):
+    # The 404 is raised up front, before any bytes are streamed
+    with pytest.raises(HTTPException) as exc_info:
+        chat_data_service.stream_log_file_messages("non_existent.csv", temp_chat_log_dir)
+    assert exc_info.value.status_code == 404
+
+
 # --- Tests for get_db_messages ---
 def test_get_db_messages_success(mock_db_client):
     video_id = "vid1"
@@ -116,25 +140,34 @@ def test_get_latest_chat_log_file_path_success(temp_chat_log_dir):
     os.utime(path1, (os.path.getatime(path1), os.path.getmtime(path1) - 100))
     os.utime(path3, (os.path.getatime(path3), os.path.getmtime(path3) - 200))
 
-    # Ensure the ctime of path2 is the latest
-    # This part of the test is a bit fragile due to relying on filesystem time manipulation
-    # A better mock would involve patching os.listdir and os.path.getctime
-
-    with patch('os.listdir') as mock_listdir, \
-         patch('os.path.getctime') as mock_getctime:
+    # ctime cannot be set directly, so fake the directory entries returned by os.scandir
+    ctimes = {path1: 100, path2: 300, path3: 50} # path2 is the newest
 
-        mock_listdir.return_value = [os.path.basename(path1), os.path.basename(path2), os.path.basename(path3)]
+    def fake_entry(path):
+        return SimpleNamespace(name=os.path.basename(path), path=path, stat=lambda: SimpleNamespace(st_ctime=ctimes[path]))
 
-        def ctime_side_effect(p):
-            if p == path1: return 100
-            if p == path2: return 300 # Newest
-            if p == path3: return 50
-            return 0
-        mock_getctime.side_effect = ctime_side_effect
+    with patch('os.scandir') as mock_scandir:
+        mock_scandir.return_value.__enter__.return_value = iter(
+            [fake_entry(path1), fake_entry(path2), fake_entry(path3), fake_entry(os.path.join(temp_chat_log_dir, "other.txt"))]
+        )
 
         latest_path = chat_data_service._get_latest_chat_log_file_path(video_id, temp_chat_log_dir)
         assert latest_path == path2
 
+        # A second lookup is served from the cache while the directory is unchanged
+        assert chat_data_service._get_latest_chat_log_file_path(video_id, temp_chat_log_dir) == path2
+        mock_scandir.assert_called_once_with(temp_chat_log_dir)
+
+def test_get_latest_chat_log_file_path_cache_invalidated_on_new_file(temp_chat_log_dir):
+    video_id = "vid_latest_new"
+    assert chat_data_service._get_latest_chat_log_file_path(video_id, temp_chat_log_dir) is None
+
+    new_path = os.path.join(temp_chat_log_dir, f"chat_log_{video_id}_20230101_100000.csv")
+    open(new_path, 'w').close()
+    # Creating the file changes the directory mtime, which invalidates the cached None
+    os.utime(temp_chat_log_dir, ns=(0, os.stat(temp_chat_log_dir).st_mtime_ns + 1))
+    assert chat_data_service._get_latest_chat_log_file_path(video_id, temp_chat_log_dir) == new_path
+
 def test_get_latest_chat_log_file_path_no_files(temp_chat_log_dir):
     assert chat_data_service._get_latest_chat_log_file_path("vid_none", temp_chat_log_dir) is None
 
@@ -167,12 +200,12 @@ def test_import_csv_to_db_success_new_messages(
 
     mock_collection = MagicMock()
     mock_db_client.__getitem__.return_value = mock_collection
-    mock_collection.find_one.return_value = None # Simulate no duplicates
+    mock_collection.insert_many.return_value.inserted_ids = ["id1", "id2"]
 
     result = chat_data_service.import_csv_to_db(video_id, mock_db_client, temp_chat_log_dir)
 
     assert result["inserted_count"] == 2
-    assert mock_collection.insert_one.call_count == 2
+    mock_open.assert_called_once_with(mock_log_path, 'r', newline='', encoding='utf-8', buffering=chat_data_service._CSV_READ_BUFFERING)
     expected_call_1 = {
         "video_id": video_id, "datetime": "2023-01-01 10:00:00",
         "author": "UserA", "message": "Msg1", "superChat": ""
@@ -181,11 +214,75 @@ def test_import_csv_to_db_success_new_messages(
         "video_id": video_id, "datetime": "2023-01-01 10:00:05",
         "author": "UserB", "message": "Msg2", "superChat": "$2"
     }
-    mock_collection.insert_one.assert_any_call(expected_call_1)
-    mock_collection.insert_one.assert_any_call(expected_call_2)
+    # A single bulk insert, with duplicates rejected by the unique index instead of a find_one per row
+    assert mock_collection.insert_many.call_count == 1
+    mock_collection.insert_many.assert_called_once_with([expected_call_1, expected_call_2], ordered=False)
+    mock_collection.create_index.assert_any_call(chat_data_service.MESSAGE_DEDUP_KEYS, unique=True)
+    mock_collection.find_one.assert_not_called()
+    mock_collection.insert_one.assert_not_called()
+
+@patch('services.chat_data_service._get_latest_chat_log_file_path')
+@patch('builtins.open', new_callable=mock.mock_open)
+@patch('csv.reader')
+def test_import_csv_to_db_skips_duplicates(
+    mock_csv_reader, mock_open, mock_get_latest_path, mock_db_client, temp_chat_log_dir
+):
+    video_id = "vid_import_dupes"
+    mock_get_latest_path.return_value = os.path.join(temp_chat_log_dir, "fake_log.csv")
+    mock_csv_reader.return_value = iter([
+        ['datetime', 'author', 'message', 'superChat'],
+        ['2023-01-01 10:00:00', 'UserA', 'Msg1', ''],
+        ['2023-01-01 10:00:05', 'UserB', 'Msg2', '$2']
+    ])
+
+    mock_collection = MagicMock()
+    mock_db_client.__getitem__.return_value = mock_collection
+    mock_collection.insert_many.side_effect = BulkWriteError({
+        "nInserted": 1,
+        "writeErrors": [{"index": 0, "code": 11000, "errmsg": "E11000 duplicate key error"}],
+    })
+
+    result = chat_data_service.import_csv_to_db(video_id, mock_db_client, temp_chat_log_dir)
+
+    assert result["inserted_count"] == 1
+    assert mock_collection.insert_many.call_count == 1
+
+@patch('services.chat_data_service._get_latest_chat_log_file_path')
+@patch('builtins.open', new_callable=mock.mock_open)
+@patch('csv.reader')
+def test_import_csv_to_db_filters_duplicates_without_index(
+    mock_csv_reader, mock_open, mock_get_latest_path, mock_db_client, temp_chat_log_dir
+):
+    video_id = "vid_import_noindex"
+    mock_get_latest_path.return_value = os.path.join(temp_chat_log_dir, "fake_log.csv")
+    mock_csv_reader.return_value = iter([
+        ['datetime', 'author', 'message', 'superChat'],
+        ['2023-01-01 10:00:00', 'UserA', 'Msg1', ''],
+        ['2023-01-01 10:00:05', 'UserB', 'Msg2', '$2'],
+        ['2023-01-01 10:00:05', 'UserB', 'Msg2', '$2'], # Duplicate within the CSV
+    ])
+
+    mock_collection = MagicMock()
+    mock_db_client.__getitem__.return_value = mock_collection
+    # The collection already holds duplicates, so the unique index cannot be built
+    mock_collection.create_index.side_effect = Exception("E11000 duplicate key error")
+    mock_collection.find.return_value = [{"datetime": "2023-01-01 10:00:00", "author": "UserA", "message": "Msg1"}]
+    mock_collection.insert_many.return_value.inserted_ids = ["id2"]
+
+    result = chat_data_service.import_csv_to_db(video_id, mock_db_client, temp_chat_log_dir)
+
+    assert result["inserted_count"] == 1
+    # Existing messages are fetched with one query, and the remaining ones are sent in one bulk insert
+    mock_collection.find.assert_called_once()
+    mock_collection.insert_many.assert_called_once_with([{
+        "video_id": video_id, "datetime": "2023-01-01 10:00:05",
+        "author": "UserB", "message": "Msg2", "superChat": "$2"
+    }], ordered=False)
+    mock_collection.find_one.assert_not_called()
 
 
 # --- Tests for get_latest_csv_messages ---
+@patch('services.chat_data_service.pacsv', None) # Exercise the stdlib csv path
 @patch('services.chat_data_service._get_latest_chat_log_file_path')
 @patch('builtins.open', new_callable=mock.mock_open)
 @patch('csv.reader')
@@ -210,24 +307,68 @@ def test_get_latest_csv_messages_success(
     assert result['messages'][1]['video_id'] == video_id
 
 
+@patch('services.chat_data_service._get_latest_chat_log_file_path')
+def test_stream_latest_csv_messages_success(mock_get_latest_path, temp_chat_log_dir):
+    video_id = "vid_stream_csv"
+    log_path = os.path.join(temp_chat_log_dir, f"chat_log_{video_id}_20230101_100000.csv")
+    with open(log_path, 'w', newline='', encoding='utf-8') as f:
+        writer = csv.writer(f)
+        writer.writerow(['datetime', 'author', 'message', 'superChat'])
+        writer.writerow(['2023-01-01 10:00:00', 'UserX', 'Hello CSV', ''])
+        writer.writerow(['not a date', 'UserY', 'Superchat here', '$5.55'])
+    mock_get_latest_path.return_value = log_path
+
+    body = b"".join(chat_data_service.stream_latest_csv_messages(video_id, temp_chat_log_dir))
+    messages = json.loads(body)['messages']
+    assert [m['author'] for m in messages] == ['UserX', 'UserY']
+    assert messages[0]['timestamp'] > 0
+    assert messages[1]['timestamp'] == 0
+    assert messages[1]['video_id'] == video_id
+
+def test_pyarrow_and_csv_readers_agree(temp_chat_log_dir):
+    pytest.importorskip("pyarrow")
+    log_path = os.path.join(temp_chat_log_dir, "chat_log_vid_arrow_20230101_100000.csv")
+    with open(log_path, 'w', newline='', encoding='utf-8') as f:
+        writer = csv.writer(f)
+        writer.writerow(['datetime', 'author', 'message', 'superChat'])
+        writer.writerow(['2023-01-01 10:00:00', 'UserA', 'multi\nline, "quoted"', ''])
+        writer.writerow(['short row'])
+        writer.writerow(['2023-07-01 22:15:30', 'ÜserB', 'Selam', '₺20,00'])
+        writer.writerow(['not a date', 'UserC', '', ''])
+
+    arrow_messages = list(chat_data_service._iter_file_messages(log_path, "vid_arrow"))
+    with patch('services.chat_data_service.pacsv', None):
+        csv_messages = list(chat_data_service._iter_file_messages(log_path, "vid_arrow"))
+    assert arrow_messages == csv_messages
+    assert len(arrow_messages) == 3
+
+@patch('services.chat_data_service._get_latest_chat_log_file_path', return_value=None)
+def test_stream_latest_csv_messages_not_found(mock_get_latest_path, temp_chat_log_dir):
+    with pytest.raises(HTTPException) as exc_info:
+        chat_data_service.stream_latest_csv_messages("vid_none", temp_chat_log_dir)
+    assert exc_info.value.status_code == 404
+
+
 # --- Tests for analyze_video_messages ---
 def test_analyze_video_messages_success(mock_db_client):
     video_id = "vid_analyze"
     mock_collection = MagicMock()
     mock_db_client.__getitem__.return_value = mock_collection
-    mock_collection.count_documents.return_value = 42
+    mock_collection.estimated_document_count.return_value = 42
 
     result = chat_data_service.analyze_video_messages(video_id, mock_db_client)
     assert result["video_id"] == video_id
     assert result["message_count"] == 42
     assert "Placeholder" in result["analysis_status"]
-    mock_collection.count_documents.assert_called_once_with({})
+    mock_collection.estimated_document_count.assert_called_once_with()
+    mock_collection.count_documents.assert_not_called()
+    mock_collection.find.assert_not_called()
 
 def test_analyze_video_messages_db_error(mock_db_client):
     video_id = "vid_analyze_err"
     mock_collection = MagicMock()
     mock_db_client.__getitem__.return_value = mock_collection
-    mock_collection.count_documents.side_effect = Exception("DB Count Error")
+    mock_collection.estimated_document_count.side_effect = Exception("DB Count Error")
 
     with pytest.raises(HTTPException) as exc_info:
         chat_data_service.analyze_video_messages(video_id, mock_db_client)
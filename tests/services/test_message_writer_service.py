@@ -1,16 +1,20 @@
 import pytest
+import os
 import csv
 from unittest import mock # For mock_open and other mocks
 from unittest.mock import MagicMock, patch
+from pymongo import WriteConcern
 
 # Service to test
 from services.message_writer_service import MessageWriterService
+from utils import MESSAGE_DEDUP_KEYS, MESSAGE_LOOKUP_KEYS
 # For type hinting and potentially direct use if not mocking all dependencies
 from config import db as actual_db_client
 # utils.create_chat_log_file is a direct dependency of the service's __init__
 
-@patch('utils.create_chat_log_file') # Mock the utility function
-def test_message_writer_service_init(mock_create_chat_log_file):
+@patch('services.message_writer_service.create_chat_log_file') # Mock the utility function
+@patch('builtins.open', new_callable=mock.mock_open)
+def test_message_writer_service_init(mock_open_file, mock_create_chat_log_file):
     """
     Test the __init__ method of MessageWriterService.
     Ensures create_chat_log_file is called and MongoDB collection is accessed.
@@ -29,13 +33,21 @@ def test_message_writer_service_init(mock_create_chat_log_file):
     mock_create_chat_log_file.assert_called_once_with(video_id, test_chat_dir)
     assert writer_service.csv_filepath == mock_csv_filepath
 
-    # Assert that the MongoDB collection was accessed correctly
+    # Assert that the MongoDB collection was accessed correctly (unacknowledged writes)
     expected_collection_name = f"messages_{video_id}"
-    mock_db.__getitem__.assert_called_once_with(expected_collection_name)
+    mock_db.get_collection.assert_called_once_with(expected_collection_name, write_concern=WriteConcern(w=0))
     assert writer_service.mongo_collection_name == expected_collection_name
+    writer_service.close()
 
+    # Indexes are created on an acknowledged handle of the same collection
+    mock_collection = mock_db.get_collection.return_value
+    mock_collection.with_options.assert_called_once_with(write_concern=WriteConcern(w=1))
+    indexed_collection = mock_collection.with_options.return_value
+    indexed_collection.create_index.assert_any_call(MESSAGE_DEDUP_KEYS, unique=True)
+    indexed_collection.create_index.assert_any_call(MESSAGE_LOOKUP_KEYS)
 
-@patch('utils.create_chat_log_file') # Keep create_chat_log_file mocked for init
+
+@patch('services.message_writer_service.create_chat_log_file') # Keep create_chat_log_file mocked for init
 @patch('builtins.open', new_callable=mock.mock_open) # Mock the open function for CSV writing
 def test_message_writer_service_write_message(mock_open_file, mock_create_chat_log_file):
     """
@@ -50,7 +62,10 @@ def test_message_writer_service_write_message(mock_open_file, mock_create_chat_l
 
     mock_db = MagicMock()
     mock_collection = MagicMock()
-    mock_db.__getitem__.return_value = mock_collection # db['collection_name'] will return mock_collection
+    mock_db.get_collection.return_value = mock_collection # db.get_collection(...) will return mock_collection
+    # Sent documents are cleared and pooled afterwards, so record copies of what insert_many received
+    inserted_batches = []
+    mock_collection.insert_many.side_effect = lambda docs, ordered: inserted_batches.append([dict(d) for d in docs])
 
     # Instantiate the service
     writer_service = MessageWriterService(video_id, mock_db, test_chat_dir)
@@ -68,25 +83,14 @@ def test_message_writer_service_write_message(mock_open_file, mock_create_chat_l
     writer_service.write_message(sample_message)
 
     # 1. Test CSV writing
-    # Assert that open was called correctly (for appending to the CSV)
-    mock_open_file.assert_called_once_with(mock_csv_filepath, 'a', newline='', encoding='utf-8')
-
-    # To assert on csv.writer().writerow(), we need to mock csv.writer
-    # This can get complex if not done carefully.
-    # For simplicity, we're checking if 'open' was called, implying an attempt to write.
-    # A more thorough test would involve:
-    # with patch('csv.writer') as mock_csv_writer_constructor:
-    #     mock_writer_instance = MagicMock()
-    #     mock_csv_writer_constructor.return_value = mock_writer_instance
-    #     writer_service.write_message(sample_message)
-    #     mock_writer_instance.writerow.assert_called_once_with([...])
+    # The CSV file is opened once in __init__ and reused for every message
+    mock_open_file.assert_called_once_with(mock_csv_filepath, 'a', newline='', encoding='utf-8', buffering=64 * 1024)
 
     # 2. Test MongoDB writing
-    # Assert that insert_one was called on the mock collection with the sample message
-    mock_collection.insert_one.assert_called_once_with(sample_message)
+    # Messages are buffered, nothing is sent until the buffer is flushed
+    mock_collection.insert_many.assert_not_called()
 
     # Test message_data without video_id initially (service should add it)
-    mock_collection.reset_mock() # Reset mock for the next call
     sample_message_no_vid = {
         "datetime": "2023-01-01 12:00:01",
         "author": "TestAuthor2",
@@ -96,13 +100,88 @@ def test_message_writer_service_write_message(mock_open_file, mock_create_chat_l
     expected_message_with_vid = sample_message_no_vid.copy()
     expected_message_with_vid["video_id"] = video_id
 
-    # We need to reset mock_open_file if it's expected to be called again
-    # For multiple calls to write_message, open is called each time.
-    mock_open_file.reset_mock()
-
     writer_service.write_message(sample_message_no_vid)
-    mock_open_file.assert_called_once_with(mock_csv_filepath, 'a', newline='', encoding='utf-8')
-    mock_collection.insert_one.assert_called_once_with(expected_message_with_vid)
+    mock_open_file.assert_called_once() # Only the open() in __init__, none per message
+
+    # close() flushes and waits for the MongoDB and CSV writer threads
+    writer_service.close()
+    mock_collection.insert_many.assert_called_once()
+    assert mock_collection.insert_many.call_args.kwargs == {"ordered": False}
+    assert inserted_batches == [[sample_message, expected_message_with_vid]]
+    assert "video_id" not in sample_message_no_vid # The caller's dict is not modified
+    mock_collection.insert_one.assert_not_called()
+    mock_open_file().write.assert_called()
+    mock_open_file().close.assert_called_once()
+
+
+@patch('services.message_writer_service.create_chat_log_file')
+@patch('builtins.open', new_callable=mock.mock_open)
+def test_message_writer_service_flushes_when_buffer_full(mock_open_file, mock_create_chat_log_file):
+    """
+    Test that write_message flushes the MongoDB buffer with a single insert_many
+    once the buffer size is reached.
+    """
+    mock_create_chat_log_file.return_value = "/tmp/test_chat_batch_dir/chat_log_batch.csv"
+    mock_db = MagicMock()
+    mock_collection = MagicMock()
+    mock_db.get_collection.return_value = mock_collection
+
+    writer_service = MessageWriterService("test_video_batch", mock_db, "/tmp/test_chat_batch_dir")
+    message_data = {}
+    for i in range(writer_service._buf_size):
+        message_data.update({"datetime": f"2023-01-01 12:00:{i % 60:02d}", "author": "A", "message": str(i), "superChat": None})
+        writer_service.write_message(message_data) # The same dict is reused, like collector.py does
+    assert writer_service._mongo_buf == []
+
+    # Closing with an empty buffer does not send another batch
+    writer_service.close()
+    mock_collection.insert_many.assert_called_once()
+    inserted_batch = mock_collection.insert_many.call_args[0][0]
+    assert len(inserted_batch) == writer_service._buf_size
+    # The sent dicts went back to the pool and are reused by the next messages
+    assert len(writer_service._dict_pool) == writer_service._buf_size
+    assert all(doc == {} for doc in inserted_batch)
+
+
+@patch('services.message_writer_service.create_chat_log_file')
+def test_message_writer_service_close_writes_csv_and_flushes(mock_create_chat_log_file, tmp_path):
+    """
+    Test that close() writes buffered rows to the CSV file, flushes MongoDB
+    and closes the file handle.
+    """
+    csv_path = tmp_path / "chat_log_close.csv"
+    csv_path.write_text("datetime,author,message,superChat\r\n", encoding="utf-8")
+    mock_create_chat_log_file.return_value = str(csv_path)
+    mock_db = MagicMock()
+    mock_collection = MagicMock()
+    mock_db.get_collection.return_value = mock_collection
+
+    writer_service = MessageWriterService("test_video_close", mock_db, str(tmp_path))
+    writer_service.write_message({"datetime": "2023-01-01 12:00:00", "author": "A", "message": "Hi", "superChat": None})
+    writer_service.close()
+
+    with open(csv_path, 'r', newline='', encoding='utf-8') as f:
+        rows = list(csv.reader(f))
+    assert rows == [['datetime', 'author', 'message', 'superChat'], ['2023-01-01 12:00:00', 'A', 'Hi', '']]
+    mock_collection.insert_many.assert_called_once()
+    assert writer_service._csv_fh.closed
+
+
+@patch('services.message_writer_service.create_chat_log_file')
+def test_message_writer_service_context_manager_closes(mock_create_chat_log_file, tmp_path):
+    """Leaving a with block closes the service even when the body raises."""
+    csv_path = tmp_path / "chat_log_with.csv"
+    csv_path.write_text("datetime,author,message,superChat\r\n", encoding="utf-8")
+    mock_create_chat_log_file.return_value = str(csv_path)
+    mock_db = MagicMock()
+
+    with pytest.raises(KeyboardInterrupt):
+        with MessageWriterService("test_video_with", mock_db, str(tmp_path)) as writer_service:
+            writer_service.write_message({"datetime": "2023-01-01 12:00:00", "author": "A", "message": "Hi", "superChat": None})
+            raise KeyboardInterrupt
+
+    assert writer_service._csv_fh.closed
+    mock_db.get_collection.return_value.insert_many.assert_called_once()
 
 
 def test_get_csv_filepath(tmp_path): # Use pytest's tmp_path fixture for a temporary directory
@@ -114,7 +193,8 @@ def test_get_csv_filepath(tmp_path): # Use pytest's tmp_path fixture for a tempo
     # We don't need to mock create_chat_log_file if we want to test its integration here
     # but the service calls it in __init__. For this unit test of get_csv_filepath,
     # it's simpler to ensure __init__ can run without side effects or mock create_chat_log_file.
-    with patch('utils.create_chat_log_file') as mock_create_chat_log_file_for_path:
+    with patch('services.message_writer_service.create_chat_log_file') as mock_create_chat_log_file_for_path, \
+         patch('builtins.open', new_callable=mock.mock_open):
         expected_path = os.path.join(test_dir, f"chat_log_{video_id}_dummy.csv")
         mock_create_chat_log_file_for_path.return_value = expected_path
 
@@ -123,6 +203,7 @@ def test_get_csv_filepath(tmp_path): # Use pytest's tmp_path fixture for a tempo
 
         assert service.get_csv_filepath() == expected_path
         mock_create_chat_log_file_for_path.assert_called_once_with(video_id, test_dir)
+        service.close()
 
 # Note: Testing the CSV writer part with mock_open can be tricky due to context managers.
 # The above test for write_message primarily checks if 'open' is called and if the DB call is made.
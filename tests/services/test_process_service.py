@@ -1,6 +1,8 @@
 import pytest
 import os
+import sys
 import signal
+import subprocess
 from unittest.mock import patch, MagicMock, ANY
 from fastapi import HTTPException
 
@@ -23,38 +25,63 @@ def temp_chat_dir(tmp_path):
     return str(d)
 
 # --- Tests for start_collector_process ---
+def make_reporting_popen(pid, report_path=None):
+    """Returns a Popen side_effect that, like collector.py, writes report_path to the fd passed in argv."""
+    def fake_popen(args, **kwargs):
+        report_fd = int(args[3])
+        assert os.get_inheritable(report_fd) # Inherited through close_fds=False, keeping the posix_spawn path
+        if report_path is not None:
+            os.write(report_fd, (report_path + "\n").encode("utf-8"))
+        proc = MagicMock()
+        proc.pid = pid
+        return proc
+    return fake_popen
+
+@patch('services.process_service._open_pidfd', return_value=None)
 @patch('subprocess.Popen')
 @patch('os.path.exists')
-@patch('os.makedirs') # To mock out directory creation attempts for log finding
-@patch('os.listdir')   # To mock out listing files for log finding
-def test_start_collector_process_success(mock_listdir, mock_makedirs, mock_os_exists, mock_popen, temp_chat_dir):
+def test_start_collector_process_success(mock_os_exists, mock_popen, mock_open_pidfd, temp_chat_dir):
     video_id = "vid_start_ok"
-    mock_os_exists.return_value = True # Assume collector.py exists
 
-    mock_process_instance = MagicMock()
-    mock_process_instance.pid = 12345
-    mock_popen.return_value = mock_process_instance
-
-    mock_listdir.return_value = [f"chat_log_{video_id}_sometime.csv"] # Simulate a log file found
+    expected_file = f"chat_log_{video_id}_sometime.csv"
+    mock_popen.side_effect = make_reporting_popen(12345, os.path.join(temp_chat_dir, expected_file))
 
     result = process_service.start_collector_process(video_id, temp_chat_dir)
 
     assert result["status"] == "started"
     assert result["pid"] == 12345
-    assert result["filename"] is not None
+    assert result["filename"] == expected_file
     assert video_id in process_service.collector_processes
-    assert process_service.collector_processes[video_id] == 12345
+    handle = process_service.collector_processes[video_id]
+    assert isinstance(handle, process_service.CollectorHandle)
+    assert handle.pid == 12345
+    assert handle.filename == expected_file
+    proc = handle.proc
+    mock_open_pidfd.assert_called_once_with(12345)
+
+    # The script path was resolved at import; starting a collector does not probe the filesystem
+    mock_os_exists.assert_not_called()
+    mock_popen.assert_called_once_with([sys.executable, process_service._COLLECTOR_SCRIPT, "--standby", ANY], env=ANY, stdin=subprocess.PIPE, close_fds=False)
+    assert mock_popen.call_args.kwargs["env"]["MONGO_PING_ON_STARTUP"] == "0"
+    proc.stdin.write.assert_called_once_with(f"{video_id}\n".encode("utf-8"))
+    proc.stdin.close.assert_called_once()
+
+
+@patch('services.process_service._open_pidfd', return_value=None)
+@patch('subprocess.Popen')
+def test_start_collector_process_no_report(mock_popen, mock_open_pidfd, temp_chat_dir):
+    """A collector that exits without reporting closes the pipe, so the start returns at once without a filename."""
+    video_id = "vid_no_report"
+    mock_popen.side_effect = make_reporting_popen(12346)
 
-    script_path_expected_1 = os.path.join(os.path.dirname(os.path.abspath(process_service.__file__)), "..", "collector.py")
-    # script_path_expected_2 is harder to predict without knowing where test is run from
-    # so we check the first attempt is good enough
-    mock_os_exists.assert_any_call(script_path_expected_1)
-    mock_popen.assert_called_once_with(["python", ANY, video_id]) # ANY for script_path due to complex construction
-    mock_listdir.assert_called_once_with(temp_chat_dir)
+    result = process_service.start_collector_process(video_id, temp_chat_dir)
 
+    assert result["status"] == "started"
+    assert result["filename"] is None
 
-@patch('os.path.exists', return_value=False) # collector.py does not exist
-def test_start_collector_process_script_not_found(mock_os_exists, temp_chat_dir):
+
+@patch('services.process_service._COLLECTOR_SCRIPT', None) # collector.py was not found at import
+def test_start_collector_process_script_not_found(temp_chat_dir):
     video_id = "vid_script_missing"
     with pytest.raises(HTTPException) as exc_info:
         process_service.start_collector_process(video_id, temp_chat_dir)
@@ -62,9 +89,8 @@ def test_start_collector_process_script_not_found(mock_os_exists, temp_chat_dir)
     assert "collector.py script not found" in exc_info.value.detail
 
 
-@patch('os.path.exists', return_value=True)
 @patch('subprocess.Popen', side_effect=Exception("Popen failed"))
-def test_start_collector_process_popen_fails(mock_popen, mock_os_exists, temp_chat_dir):
+def test_start_collector_process_popen_fails(mock_popen, temp_chat_dir):
     video_id = "vid_popen_fail"
     with pytest.raises(HTTPException) as exc_info:
         process_service.start_collector_process(video_id, temp_chat_dir)
@@ -72,23 +98,100 @@ def test_start_collector_process_popen_fails(mock_popen, mock_os_exists, temp_ch
     assert "Failed to start collector process" in exc_info.value.detail
 
 
+def test_find_collector_script():
+    expected = os.path.join(os.path.dirname(os.path.abspath(process_service.__file__)), "..", "collector.py")
+    assert process_service._find_collector_script() == expected
+    with patch('os.path.exists', return_value=False):
+        assert process_service._find_collector_script() is None
+
+
+# --- Tests for the standby pool ---
+@pytest.fixture
+def warm_pool():
+    """Empties the standby pool around a test."""
+    process_service.shutdown_warm_pool()
+    yield process_service._warm_pool
+    process_service.shutdown_warm_pool()
+
+def make_standby(pid, report_path=None):
+    """A standby collector whose report pipe already holds report_path."""
+    read_fd, write_fd = os.pipe()
+    if report_path is not None:
+        os.write(write_fd, (report_path + "\n").encode("utf-8"))
+    os.close(write_fd)
+    proc = MagicMock()
+    proc.pid = pid
+    proc.poll.return_value = None
+    return proc, read_fd
+
+@patch('services.process_service._open_pidfd', return_value=None)
+@patch('services.process_service.threading.Thread')
+@patch('subprocess.Popen')
+def test_start_collector_process_uses_standby(mock_popen, mock_thread, mock_open_pidfd, warm_pool, temp_chat_dir):
+    video_id = "vid_warm"
+    standby = make_standby(777, os.path.join(temp_chat_dir, "chat_log_vid_warm_1.csv"))
+    warm_pool.put(standby)
+    process_service._warm_pool_target = 1
+
+    result = process_service.start_collector_process(video_id, temp_chat_dir)
+
+    assert result == {"status": "started", "pid": 777, "filename": "chat_log_vid_warm_1.csv"}
+    mock_popen.assert_not_called() # No interpreter start on the request path
+    standby[0].stdin.write.assert_called_once_with(b"vid_warm\n")
+    # The pool is topped up in the background
+    mock_thread.assert_called_once_with(target=process_service._refill_warm_pool, name=ANY, daemon=True)
+
+def test_take_standby_skips_exited(warm_pool):
+    dead = make_standby(1)
+    dead[0].poll.return_value = 1 # Exited while idle
+    alive = make_standby(2)
+    warm_pool.put(dead)
+    warm_pool.put(alive)
+
+    assert process_service._take_standby() == alive
+    assert process_service._take_standby() is None
+    os.close(alive[1])
+
+@patch('services.process_service._spawn_standby')
+def test_prewarm_and_shutdown_warm_pool(mock_spawn, warm_pool):
+    standbys = [make_standby(10), make_standby(11)]
+    mock_spawn.side_effect = standbys
+
+    process_service.prewarm_collectors(2)
+    assert warm_pool.qsize() == 2
+
+    process_service.shutdown_warm_pool()
+    assert warm_pool.empty()
+    assert process_service._warm_pool_target == 0
+    for proc, _ in standbys:
+        proc.stdin.close.assert_called_once() # EOF tells the standby to exit
+        proc.wait.assert_called_once_with(timeout=process_service.STOP_TIMEOUT)
+
+
 # --- Tests for stop_collector_process ---
-@patch('psutil.Process')
-def test_stop_collector_process_success(mock_psutil_process):
+def make_popen_mock(pid):
+    """A Popen-like mock for a collector that is still running."""
+    proc = MagicMock()
+    proc.pid = pid
+    proc.poll.return_value = None
+    return proc
+
+@patch('os.kill')
+@patch('services.process_service.threading.Thread')
+def test_stop_collector_process_success(mock_thread, mock_kill):
     video_id = "vid_stop_ok"
-    pid = 12345
-    process_service.collector_processes[video_id] = pid
-
-    mock_proc_obj = MagicMock()
-    mock_psutil_process.return_value = mock_proc_obj
+    proc = make_popen_mock(12345)
+    process_service.collector_processes[video_id] = process_service.CollectorHandle(proc)
 
     result = process_service.stop_collector_process(video_id)
 
     assert result["status"] == "stopped"
     assert video_id not in process_service.collector_processes
-    mock_psutil_process.assert_called_once_with(pid)
-    mock_proc_obj.send_signal.assert_called_once_with(signal.SIGINT)
-    mock_proc_obj.wait.assert_called_once_with(timeout=5)
+    mock_kill.assert_called_once_with(12345, signal.SIGINT)
+    # The wait happens in a background reaper thread, not in the request
+    proc.wait.assert_not_called()
+    mock_thread.assert_called_once_with(target=process_service._reap_collector, args=(video_id, proc, None), name=ANY, daemon=True)
+    mock_thread.return_value.start.assert_called_once()
 
 
 def test_stop_collector_process_not_running():
@@ -99,80 +202,144 @@ def test_stop_collector_process_not_running():
     assert "not found or not running" in exc_info.value.detail
 
 
-@patch('psutil.Process', side_effect=psutil.NoSuchProcess(123))
-def test_stop_collector_process_no_such_process(mock_psutil_process):
+@patch('os.kill')
+def test_stop_collector_process_already_exited(mock_kill):
+    video_id = "vid_exited"
+    proc = make_popen_mock(123)
+    proc.poll.return_value = 0 # Process has already exited
+    process_service.collector_processes[video_id] = process_service.CollectorHandle(proc)
+
+    with pytest.raises(HTTPException) as exc_info:
+        process_service.stop_collector_process(video_id)
+    assert exc_info.value.status_code == 404
+    assert "was already stopped or not found" in exc_info.value.detail
+    assert video_id not in process_service.collector_processes # Should be cleaned up
+    mock_kill.assert_not_called()
+
+
+@patch('os.kill', side_effect=ProcessLookupError(3, "No such process"))
+def test_stop_collector_process_no_such_process(mock_kill):
     video_id = "vid_no_such_proc"
-    process_service.collector_processes[video_id] = 123 # Assume it was running
+    proc = make_popen_mock(123)
+    process_service.collector_processes[video_id] = process_service.CollectorHandle(proc) # Assume it was running
 
     with pytest.raises(HTTPException) as exc_info:
         process_service.stop_collector_process(video_id)
-    assert exc_info.value.status_code == 404 # Service converts NoSuchProcess to 404
+    assert exc_info.value.status_code == 404 # Service converts ProcessLookupError to 404
     assert "was already stopped or not found" in exc_info.value.detail
     assert video_id not in process_service.collector_processes # Should be cleaned up
 
 
-@patch('psutil.Process')
-def test_stop_collector_process_timeout_and_killed(mock_psutil_process):
-    video_id = "vid_timeout"
-    pid = 12345
-    process_service.collector_processes[video_id] = pid
+@patch('os.kill', side_effect=PermissionError("Operation not permitted"))
+def test_stop_collector_process_signal_fails_other_exception(mock_kill):
+    video_id = "vid_signal_fail"
+    proc = make_popen_mock(12345)
+    process_service.collector_processes[video_id] = process_service.CollectorHandle(proc)
 
-    mock_proc_obj = MagicMock()
-    mock_psutil_process.return_value = mock_proc_obj
-    mock_proc_obj.wait.side_effect = [psutil.TimeoutExpired(seconds=5), None] # First wait times out, second (after kill) is fine
+    with pytest.raises(HTTPException) as exc_info:
+        process_service.stop_collector_process(video_id)
+    assert exc_info.value.status_code == 500
+    assert "unexpected error occurred while stopping collector" in exc_info.value.detail
 
-    result = process_service.stop_collector_process(video_id)
 
-    assert result["status"] == "killed"
-    assert "forcefully killed" in result["detail"]
-    assert video_id not in process_service.collector_processes
-    mock_proc_obj.send_signal.assert_called_once_with(signal.SIGINT)
-    mock_proc_obj.kill.assert_called_once()
-    assert mock_proc_obj.wait.call_count == 2
+def test_stop_collector_process_already_exited_closes_pidfd():
+    video_id = "vid_exited_pidfd"
+    proc = make_popen_mock(123)
+    proc.poll.return_value = 0
+    read_fd, write_fd = os.pipe() # Any real fd stands in for the pidfd
+    os.close(write_fd)
+    process_service.collector_processes[video_id] = process_service.CollectorHandle(proc, read_fd)
 
+    with pytest.raises(HTTPException):
+        process_service.stop_collector_process(video_id)
+    with pytest.raises(OSError):
+        os.fstat(read_fd) # Already closed by the service
 
-@patch('psutil.Process')
-def test_stop_collector_process_timeout_kill_fails_no_such_process(mock_psutil_process):
-    video_id = "vid_timeout_kill_fail_nsp"
-    pid = 12345
-    process_service.collector_processes[video_id] = pid
 
-    mock_proc_obj = MagicMock()
-    mock_psutil_process.return_value = mock_proc_obj
-    mock_proc_obj.wait.side_effect = psutil.TimeoutExpired(seconds=5)
-    mock_proc_obj.kill.side_effect = psutil.NoSuchProcess(pid) # Process dies before kill completes
+@pytest.mark.skipif(not hasattr(os, "pidfd_open"), reason="pidfd_open is Linux-only")
+@patch('os.kill')
+def test_stop_collector_process_signals_through_pidfd(mock_kill):
+    video_id = "vid_stop_pidfd"
+    proc = subprocess.Popen([sys.executable, "-c", "import time; time.sleep(30)"])
+    pidfd = os.pidfd_open(proc.pid)
+    process_service.collector_processes[video_id] = process_service.CollectorHandle(proc, pidfd)
 
-    with pytest.raises(HTTPException) as exc_info:
+    with patch('services.process_service.threading.Thread'):
         process_service.stop_collector_process(video_id)
-    assert exc_info.value.status_code == 404
-    assert "disappeared during kill attempt" in exc_info.value.detail
-    assert video_id not in process_service.collector_processes
 
+    mock_kill.assert_not_called() # Signalled with pidfd_send_signal instead
+    assert proc.wait(timeout=5) != 0
+    os.close(pidfd)
 
-@patch('psutil.Process')
-def test_stop_collector_process_timeout_kill_fails_other_exception(mock_psutil_process):
-    video_id = "vid_timeout_kill_fail_other"
-    pid = 12345
-    process_service.collector_processes[video_id] = pid
 
-    mock_proc_obj = MagicMock()
-    mock_psutil_process.return_value = mock_proc_obj
-    mock_proc_obj.wait.side_effect = psutil.TimeoutExpired(seconds=5)
-    mock_proc_obj.kill.side_effect = RuntimeError("Kill error")
+@patch('os.kill')
+@patch('services.process_service.threading.Thread')
+def test_stop_collector_process_concurrent_stops_signal_once(mock_thread, mock_kill):
+    from concurrent.futures import ThreadPoolExecutor
+    video_id = "vid_stop_race"
+    process_service.collector_processes[video_id] = process_service.CollectorHandle(make_popen_mock(4242))
 
-    with pytest.raises(HTTPException) as exc_info:
-        process_service.stop_collector_process(video_id)
-    assert exc_info.value.status_code == 500
-    assert "Error forcefully stopping process" in exc_info.value.detail
-    # In this specific error case, the PID might remain in collector_processes
-    # depending on the desired robustness vs. cleanup. The current code
-    # does not remove it if kill() itself raises an unexpected error.
-    assert video_id in process_service.collector_processes
+    def stop():
+        try:
+            return process_service.stop_collector_process(video_id)["status"]
+        except HTTPException as e:
+            return e.status_code
+
+    with ThreadPoolExecutor(max_workers=8) as pool:
+        results = list(pool.map(lambda _: stop(), range(8)))
+
+    assert results.count("stopped") == 1
+    assert results.count(404) == 7
+    mock_kill.assert_called_once_with(4242, signal.SIGINT)
+
+
+# --- Tests for the background reaper ---
+def test_reap_collector_exits_gracefully():
+    proc = make_popen_mock(12345)
+    process_service._reap_collector("vid_reap_ok", proc)
+    proc.wait.assert_called_once_with(timeout=process_service.STOP_TIMEOUT)
+    proc.kill.assert_not_called()
+
+
+def test_reap_collector_timeout_and_killed():
+    proc = make_popen_mock(12345)
+    proc.wait.side_effect = [subprocess.TimeoutExpired(cmd="collector.py", timeout=5), None] # First wait times out, second (after kill) is fine
+
+    process_service._reap_collector("vid_timeout", proc)
+
+    proc.kill.assert_called_once()
+    assert proc.wait.call_count == 2
+
+
+def test_reap_collector_kill_fails():
+    proc = make_popen_mock(12345)
+    proc.wait.side_effect = subprocess.TimeoutExpired(cmd="collector.py", timeout=5)
+    proc.kill.side_effect = ProcessLookupError(3, "No such process") # Process dies before kill completes
+
+    # Errors in the background thread are logged, not raised
+    process_service._reap_collector("vid_timeout_kill_fail", proc)
+    proc.kill.assert_called_once()
+
+
+@pytest.mark.skipif(not hasattr(os, "pidfd_open"), reason="pidfd_open is Linux-only")
+def test_reap_collector_waits_on_pidfd():
+    proc = subprocess.Popen([sys.executable, "-c", "import time; time.sleep(30)"])
+    pidfd = os.pidfd_open(proc.pid)
+    proc.send_signal(signal.SIGINT) # KeyboardInterrupt ends the child right away
+
+    process_service._reap_collector("vid_reap_pidfd", proc, pidfd)
+
+    assert proc.returncode is not None # Reaped, not left as a zombie
+    with pytest.raises(OSError):
+        os.fstat(pidfd) # Closed by the reaper
 
 
 # --- Test for get_running_processes ---
 def test_get_running_processes():
-    process_service.collector_processes = {"vid1": 123, "vid2": 456}
+    process_service.collector_processes = {
+        "vid1": process_service.CollectorHandle(make_popen_mock(123)),
+        "vid2": process_service.CollectorHandle(make_popen_mock(456)),
+    }
     assert process_service.get_running_processes() == {"vid1": 123, "vid2": 456}
     # Ensure it's a copy
     assert process_service.get_running_processes() is not process_service.collector_processes
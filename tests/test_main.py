@@ -2,7 +2,8 @@ import pytest
 from fastapi.testclient import TestClient
 from main import app # Assuming your FastAPI app instance is named 'app' in main.py
 import os # Keep os for path manipulation if needed, but CHAT_LOG_DIR_TEST might not be necessary
-from unittest.mock import patch, MagicMock
+from unittest.mock import patch, MagicMock, ANY
+import orjson
 from fastapi import HTTPException # To test for raised HTTPExceptions
 
 client = TestClient(app)
@@ -144,9 +145,104 @@ def test_start_chat_collection_service_error_with_correct_chat_log_dir(mock_star
     assert response.json() == {"detail": "Failed to start collector"}
     mock_start_collector.assert_called_once_with(video_id, chat_log_dir=ACTUAL_CHAT_LOG_DIR)
 
+@patch('services.chat_data_service.stream_log_file_messages')
+def test_get_chat_log_streams_service_output(mock_stream_log_file_messages):
+    filename = "chat_log_testvideo123_timestamp.csv"
+    mock_stream_log_file_messages.return_value = iter([b'{"messages":[', b'{"author":"UserA"}', b']}'])
+
+    response = client.get(f"/chat_log/{filename}")
+    assert response.status_code == 200
+    assert response.json() == {"messages": [{"author": "UserA"}]}
+    mock_stream_log_file_messages.assert_called_once_with(filename, chat_log_dir=ACTUAL_CHAT_LOG_DIR)
+
+@patch('services.chat_data_service.stream_log_file_messages')
+def test_get_chat_log_not_found(mock_stream_log_file_messages):
+    mock_stream_log_file_messages.side_effect = HTTPException(status_code=404, detail="File 'missing.csv' not found.")
+
+    response = client.get("/chat_log/missing.csv")
+    assert response.status_code == 404
+
+@patch('services.chat_data_service.get_db_messages')
+@patch('fastapi.routing.jsonable_encoder')
+def test_get_messages_encoded_with_orjson(mock_jsonable_encoder, mock_get_db_messages):
+    messages = {"messages": [{"video_id": "vid", "author": "UserA", "message": "Héllo"}]}
+    mock_get_db_messages.return_value = messages
+    response = client.get("/messages/vid")
+    assert response.status_code == 200
+    assert response.content == orjson.dumps(messages)
+    mock_get_db_messages.assert_called_once_with("vid", db_client=ANY)
+    mock_jsonable_encoder.assert_not_called() # The message list is not walked a second time
+
+def test_get_messages_collection_is_cached():
+    from main import get_messages_collection
+    get_messages_collection.cache_clear()
+    with patch('main.db') as mock_db:
+        first = get_messages_collection("vid_cached")
+        assert get_messages_collection("vid_cached") is first
+        mock_db.__getitem__.assert_called_once_with("messages_vid_cached")
+    get_messages_collection.cache_clear()
+
 # TODO: Add tests for other data endpoints, mocking services.chat_data_service functions:
-# - /chat_log/{filename} -> services.chat_data_service.get_log_file_messages
-# - /messages/{video_id} -> services.chat_data_service.get_db_messages
 # - /analyze/{video_id} -> services.chat_data_service.analyze_video_messages
-# - /chat_log_messages/{video_id} -> services.chat_data_service.get_latest_csv_messages
+# - /chat_log_messages/{video_id} -> services.chat_data_service.stream_latest_csv_messages
 # - /import_csv_to_mongo/{video_id} -> services.chat_data_service.import_csv_to_db
+
+# Tests for the pytchat background collection helper
+def test_collect_chat_async_returns_when_stream_ends():
+    import asyncio
+    from main import collect_chat_async
+
+    async def run():
+        async def listen():
+            await asyncio.sleep(0)
+
+        fake_livechat = MagicMock()
+        fake_livechat.listen_task = asyncio.ensure_future(listen())
+        with patch('pytchat.LiveChatAsync', return_value=fake_livechat):
+            # Must finish as soon as the listen task ends, without a polling delay
+            await asyncio.wait_for(collect_chat_async("testvideo123", "unused.csv"), timeout=1)
+        fake_livechat.terminate.assert_not_called()
+
+    asyncio.run(run())
+
+def test_collect_chat_async_cancel_terminates_livechat():
+    import asyncio
+    from main import collect_chat_async
+
+    async def run():
+        fake_livechat = MagicMock()
+        fake_livechat.listen_task = asyncio.ensure_future(asyncio.sleep(60))
+        with patch('pytchat.LiveChatAsync', return_value=fake_livechat):
+            task = asyncio.ensure_future(collect_chat_async("testvideo123", "unused.csv"))
+            await asyncio.sleep(0)
+            task.cancel()
+            with pytest.raises(asyncio.CancelledError):
+                await task
+        fake_livechat.terminate.assert_called_once()
+        fake_livechat.listen_task.cancel()
+
+    asyncio.run(run())
+
+def test_chat_callback_writes_batch_once(tmp_path):
+    import asyncio
+    from types import SimpleNamespace
+    from main import chat_callback
+
+    filename = str(tmp_path / "chat_log_testvideo123_timestamp.csv")
+    items = [
+        SimpleNamespace(datetime="2023-01-01 10:00:00", author=SimpleNamespace(name="UserA"), message="Hi", amountString=""),
+        SimpleNamespace(datetime="2023-01-01 10:00:01", author=SimpleNamespace(name="UserB"), message="Hey", amountString="$5.00"),
+    ]
+    async def tick_async():
+        pass
+    chatdata = SimpleNamespace(items=items, tick_async=tick_async)
+
+    with patch('main.get_messages_collection') as mock_get_collection:
+        asyncio.run(chat_callback(chatdata, filename, "testvideo123"))
+
+    with open(filename, newline='', encoding='utf-8') as f:
+        assert f.read().splitlines() == ["2023-01-01 10:00:00,UserA,Hi,", "2023-01-01 10:00:01,UserB,Hey,$5.00"]
+    mock_get_collection.return_value.insert_many.assert_called_once_with(ANY, ordered=False)
+    inserted = mock_get_collection.return_value.insert_many.call_args[0][0]
+    assert [m["author"] for m in inserted] == ["UserA", "UserB"]
+    assert all(m["video_id"] == "testvideo123" for m in inserted)
@@ -4,6 +4,11 @@ from datetime import datetime
 
 # CHAT_LOG_DIR will now be passed as an argument
 
+# Fields that identify a chat message; a unique index on them lets MongoDB skip duplicates.
+MESSAGE_DEDUP_KEYS = [("video_id", 1), ("datetime", 1), ("author", 1), ("message", 1)]
+# Collections are per video, so the lookup index can leave out video_id to save RAM.
+MESSAGE_LOOKUP_KEYS = [("datetime", 1), ("author", 1)]
+
 def create_chat_log_file(video_id: str, chat_log_dir: str) -> str:
     """
     Creates a new CSV chat log file for a given video_id in the specified chat_log_dir.
@@ -21,3 +26,12 @@ def create_chat_log_file(video_id: str, chat_log_dir: str) -> str:
         writer.writerow(['datetime', 'author', 'message', 'superChat'])
     print(f"[Utils] Created chat log file: {filepath}")
     return filepath
+
+def ensure_message_indexes(collection):
+    """
+    Creates the indexes used on a messages_<video_id> collection: the unique dedup index
+    and a (datetime, author) lookup index. create_index is idempotent, so this is safe to
+    call on every start.
+    """
+    collection.create_index(MESSAGE_DEDUP_KEYS, unique=True)
+    collection.create_index(MESSAGE_LOOKUP_KEYS)